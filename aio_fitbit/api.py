@@ -1,7 +1,8 @@
 from .apis._base import ApiBase
+from .apis.activity import Activity
 from .apis.heartrate import Heartrate
 
 
-class FitbitApi(Heartrate, ApiBase):
+class FitbitApi(Heartrate, Activity, ApiBase):
 
     pass
@@ -1,20 +1,96 @@
 import asyncio
+from collections import OrderedDict
+import string
+import time
+
+
+# Maps each endpoint's `NAME` to its `ApiEndpoint` class.
+ENDPOINT_REGISTRY = {}
+
+
+class UrlTemplate():
+
+    def __init__(self, template):
+        self.template = template
+        self.fields = frozenset(
+            field for _, field, _, _ in string.Formatter().parse(template)
+            if field
+        )
+        self._format_map = template.format_map
+
+    def expand(self, **values):
+        missing = self.fields.difference(values)
+        if missing:
+            raise ValueError('Missing values for %s in %r' % (', '.join(sorted(missing)), self.template))
+        return self._format_map(values)
+
+    def __repr__(self):
+        return '{}({!r})'.format(self.__class__.__name__, self.template)
+
+
+class ResponseCache():
+    """Parsed responses by endpoint and URL, each kept for a given number of seconds.
+
+    Past `max_entries` the least recently used are dropped; 0 disables caching.
+    """
+
+    def __init__(self, max_entries=64):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+
+    def __getitem__(self, key):
+        expires, value = self._entries[key]
+        if expires <= time.monotonic():
+            del self._entries[key]
+            raise KeyError(key)
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key, value, seconds):
+        if self.max_entries <= 0:
+            return
+        self._entries[key] = (time.monotonic() + seconds, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
 
 
 class ApiBase():
 
-    def __init__(self, *, client, user='-'):
+    def __init__(self, *, client, user='-', priority=None, cache=None):
         self._client = client
         self._user = user
+        self._priority = priority
+        # Shared by every endpoint; see `ApiEndpoint.CACHE_SECONDS`.
+        self._cache = ResponseCache() if cache is None else cache
 
     @asyncio.coroutine
-    def request(self, method, url, query_params=None, **kwargs):
+    def request(self, method, url, query_params=None, priority=None, **kwargs):
         print('ApiBase.request', method, url, type(self._client))
-        return self._client.request(method, url, **kwargs)
+        if priority is None:
+            priority = self._priority
+        return self._client.request(method, url, priority=priority, **kwargs)
 
 
 class ApiEndpointMetaclass(type):
 
+    def __init__(cls, name, bases, namespace):
+        super().__init__(name, bases, namespace)
+        if 'URL_TEMPLATES' in namespace:
+            # Parse the templates once, when the endpoint is declared.
+            cls.URL_TEMPLATES = {
+                key: template if isinstance(template, UrlTemplate) else UrlTemplate(template)
+                for key, template in namespace['URL_TEMPLATES'].items()
+            }
+        if namespace.get('NAME'):
+            ENDPOINT_REGISTRY[namespace['NAME']] = cls
+
     def as_api(cls, **initkwargs):
         @asyncio.coroutine
         def api(api_base_self, *args, **kwargs):
@@ -25,14 +101,39 @@ class ApiEndpointMetaclass(type):
 
 class ApiEndpoint(metaclass=ApiEndpointMetaclass):
 
+    NAME = None
+    URL_TEMPLATES = {}
+    # How long a parsed response is reused for the same URL; None to always
+    # request it. Every caller gets the same cached result; see `freeze_result`.
+    CACHE_SECONDS = 300
+
     def __init__(self, *, api_base):
         self.api_base = api_base
 
     @asyncio.coroutine
-    def call(self, *args, **kwargs):
+    def call(self, *args, priority=None, hedge=False, **kwargs):
         url = self.build_url(*args, **kwargs)
-        response = yield from self.api_base.request('GET', url)
-        return (yield from self.parse_response(response))
+        name = self.NAME or self.__class__.__name__
+        cache = self.api_base._cache if self.CACHE_SECONDS and self.is_cacheable(*args, **kwargs) else None
+        if cache is not None:
+            try:
+                return cache[name, url]
+            except KeyError:
+                pass
+        response = yield from self.api_base.request('GET', url, priority=priority, hedge=hedge, endpoint=name)
+        result = yield from self.parse_response(response)
+        if cache is not None:
+            self.freeze_result(result)
+            cache.set((name, url), result, self.CACHE_SECONDS)
+        return result
+
+    def is_cacheable(self, *args, **kwargs):
+        """Whether the response for these `call` arguments can be cached."""
+        return True
+
+    def freeze_result(self, result):
+        """Make a result that is about to be cached, and shared, read only where possible."""
+        pass
 
     def build_url(self, url_parts, base_url=None, extension='.json'):
         if base_url is None:
@@ -41,13 +142,11 @@ class ApiEndpoint(metaclass=ApiEndpointMetaclass):
         url = url.replace('//', '/')
         return url
 
+    def expand_url(self, template_name, **values):
+        return self.URL_TEMPLATES[template_name].expand(**values)
+
     @asyncio.coroutine
     def parse_response(self, response):
-        if self._save_response:
-            data = yield from response.text()
-            filename = response.url.replace('/', '_').replace(':', '')
-            with open(filename, 'w') as file:
-                file.write(data)
         json = yield from response.json()
         if 'errors' in json:
             raise ValueError("Fitbit indicated request failed." + repr(json))
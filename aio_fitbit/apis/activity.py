@@ -0,0 +1,40 @@
+import numpy as np
+
+from aio_fitbit.apis._base import ApiBase
+from aio_fitbit.apis.timeseries import IntradayTimeSeriesEndpoint
+
+
+class IntradayStepsEndpoint(IntradayTimeSeriesEndpoint):
+
+    NAME = 'intraday_steps'
+    RESOURCE = 'steps'
+    VALUE_DTYPE = np.int32
+
+
+class IntradayCaloriesEndpoint(IntradayTimeSeriesEndpoint):
+
+    NAME = 'intraday_calories'
+    RESOURCE = 'calories'
+    VALUE_DTYPE = np.float64
+
+
+class IntradayDistanceEndpoint(IntradayTimeSeriesEndpoint):
+
+    NAME = 'intraday_distance'
+    RESOURCE = 'distance'
+    VALUE_DTYPE = np.float64
+
+
+class IntradayFloorsEndpoint(IntradayTimeSeriesEndpoint):
+
+    NAME = 'intraday_floors'
+    RESOURCE = 'floors'
+    VALUE_DTYPE = np.int32
+
+
+class Activity(ApiBase):
+
+    intraday_steps = IntradayStepsEndpoint.as_api()
+    intraday_calories = IntradayCaloriesEndpoint.as_api()
+    intraday_distance = IntradayDistanceEndpoint.as_api()
+    intraday_floors = IntradayFloorsEndpoint.as_api()
@@ -1,11 +1,11 @@
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
+from collections.abc import Mapping
 import datetime
-import warnings
 
-from frozenordereddict import FrozenOrderedDict
+import numpy as np
 
-from aio_fitbit.apis._base import ApiBase, ApiEndpoint
-from aio_fitbit.exceptions import FitbitApiWarning
+from aio_fitbit.apis._base import ApiBase
+from aio_fitbit.apis.timeseries import IntradayTimeSeries, IntradayTimeSeriesEndpoint
 
 
 class HeartrateZone(namedtuple('HeartrateZone', ['calories_out', 'min', 'max', 'minutes', 'name'])):
@@ -42,130 +42,251 @@ class HeartrateResult(namedtuple('HeartrateResult', ['heart_rate_zones', 'custom
         )
 
 
-class HeartrateResults(FrozenOrderedDict):
+class HeartrateResultView():
+    """A `HeartrateResult`-like view of one day of a `HeartrateResults`."""
 
-    @classmethod
-    def build_from_response(cls, heart_respones_list):
-        parsed_tuples = []
-        for entry in heart_respones_list:
-            date = datetime.datetime.strptime(entry['dateTime'], '%Y-%m-%d').date()
-            value = HeartrateResult.build_from_response(entry['value'])
-            parsed_tuples.append((date, value))
-        return cls(parsed_tuples)
+    __slots__ = ('_results', '_offset')
+
+    _fields = HeartrateResult._fields
 
+    def __init__(self, results, offset):
+        self._results = results
+        self._offset = offset
+
+    @property
+    def heart_rate_zones(self):
+        return self._results.zones_for_offset(self._offset)
+
+    @property
+    def custom_heart_rate_zones(self):
+        return self._results.custom_zones.get(self._offset, ())
+
+    @property
+    def resting_heart_rate(self):
+        resting_heart_rate = self._results.resting_heart_rate[self._offset]
+        if np.isnan(resting_heart_rate):
+            return None
+        return int(resting_heart_rate)
 
-class IntradayHeartrateResults(FrozenOrderedDict):
+    def to_namedtuple(self):
+        return HeartrateResult._make(self)
+
+    def _asdict(self):
+        return OrderedDict(zip(self._fields, self))
+
+    def __iter__(self):
+        yield self.heart_rate_zones
+        yield self.custom_heart_rate_zones
+        yield self.resting_heart_rate
+
+    def __len__(self):
+        return len(self._fields)
+
+    def __getitem__(self, idx):
+        return tuple(self)[idx]
+
+    def __eq__(self, other):
+        if isinstance(other, (tuple, HeartrateResultView)):
+            return tuple(self) == tuple(other)
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(tuple(self))
+
+    def __repr__(self):
+        return repr(self.to_namedtuple())
 
-    __slots__ = ('_interval', '_interval_type')
+
+class HeartrateResults(Mapping):
+    """Daily heart rate summaries, stored as arrays indexed by day offset.
+
+    `resting_heart_rate` has one entry per day from `start_date`, and
+    `zones` has shape (days, zones, len(ZONE_FIELDS)). Missing values are
+    NaN, and days without a summary are False in `present`.
+    """
+
+    ZONE_FIELDS = ('calories_out', 'min', 'max', 'minutes')
+    _RESPONSE_ZONE_KEYS = ('caloriesOut', 'min', 'max', 'minutes')
+
+    __slots__ = ('start_date', 'present', 'resting_heart_rate', 'zone_names', 'zones', 'custom_zones', '_len')
 
     @classmethod
-    def build_from_response(cls, intraday_respones_dict):
-        dataset = intraday_respones_dict.get('dataset', [])
-        parsed_tuples = []
-        for entry in dataset:
-            value = entry['value']
-            time = datetime.datetime.strptime(entry['time'], '%H:%M:%S').time()
-            parsed_tuples.append((time, value))
+    def build_from_response(cls, heart_respones_list):
+        if not heart_respones_list:
+            return cls.empty()
+        # Parse all of the dates at once.
+        dates = np.array([entry['dateTime'] for entry in heart_respones_list], dtype='datetime64[D]')
+        start = dates.min()
+        offsets = (dates - start).astype(np.int64)
+        day_count = int(offsets.max()) + 1
+
+        resting_heart_rate = np.full(day_count, np.nan)
+        zone_index = OrderedDict()
+        zone_rows = []
+        zone_columns = []
+        zone_values = []
+        custom_zones = {}
+        for offset, entry in zip(offsets.tolist(), heart_respones_list):
+            day = entry['value']
+            if day.get('restingHeartRate') is not None:
+                resting_heart_rate[offset] = day['restingHeartRate']
+            for zone in day.get('heartRateZones', ()):
+                zone_rows.append(offset)
+                zone_columns.append(zone_index.setdefault(zone.get('name'), len(zone_index)))
+                zone_values.append([zone.get(key, np.nan) for key in cls._RESPONSE_ZONE_KEYS])
+            if day.get('customHeartRateZones'):
+                custom_zones[offset] = tuple(
+                    HeartrateZone.build_from_response(zone) for zone in day['customHeartRateZones'])
+
+        zones = np.full((day_count, len(zone_index), len(cls.ZONE_FIELDS)), np.nan)
+        if zone_values:
+            zones[zone_rows, zone_columns] = np.array(zone_values, dtype=np.float64)
+        present = np.zeros(day_count, dtype=bool)
+        present[offsets] = True
         return cls(
-            dataset=parsed_tuples,
-            interval=intraday_respones_dict['datasetInterval'],
-            interval_type=intraday_respones_dict['datasetType'],
+            start_date=start.item(),
+            present=present,
+            resting_heart_rate=resting_heart_rate,
+            zone_names=tuple(zone_index),
+            zones=zones,
+            custom_zones=custom_zones,
         )
 
-    def __init__(self, dataset, interval, interval_type):
-        super().__init__(dataset)
-        self._interval = interval
-        self._interval_type = interval_type
-
-    @property
-    def interval(self):
-        return self._interval
+    @classmethod
+    def empty(cls):
+        return cls(
+            start_date=None,
+            present=np.zeros(0, dtype=bool),
+            resting_heart_rate=np.zeros(0),
+            zone_names=(),
+            zones=np.zeros((0, 0, len(cls.ZONE_FIELDS))),
+        )
 
-    def interval_type(self):
-        return self._interval_type
+    def __init__(self, start_date, present, resting_heart_rate, zone_names, zones, custom_zones=None):
+        self.start_date = start_date
+        self.present = present
+        self.resting_heart_rate = resting_heart_rate
+        self.zone_names = tuple(zone_names)
+        self.zones = zones
+        self.custom_zones = custom_zones or {}
+        self._len = int(np.count_nonzero(present))
+
+    def freeze(self):
+        """Make the arrays read only, so the results can be shared."""
+        for array in (self.present, self.resting_heart_rate, self.zones):
+            array.flags.writeable = False
+
+    def zone_field(self, field):
+        """Return a (days, zones) array of one of the `ZONE_FIELDS`."""
+        return self.zones[:, :, self.ZONE_FIELDS.index(field)]
+
+    def zones_for_offset(self, offset):
+        zones = []
+        for name, (calories_out, min_, max_, minutes) in zip(self.zone_names, self.zones[offset].tolist()):
+            if np.isnan(minutes) and np.isnan(calories_out):
+                # This zone wasn't reported for this day.
+                continue
+            zones.append(HeartrateZone(
+                calories_out=None if np.isnan(calories_out) else calories_out,
+                min=None if np.isnan(min_) else int(min_),
+                max=None if np.isnan(max_) else int(max_),
+                minutes=None if np.isnan(minutes) else int(minutes),
+                name=name,
+            ))
+        return tuple(zones)
+
+    def offset_of(self, date):
+        if self.start_date is None:
+            return None
+        return (date - self.start_date).days
+
+    def _offset_range(self, start=None, end=None):
+        if self.start_date is None:
+            return 0, 0
+        lower = 0 if start is None else max(0, self.offset_of(start))
+        upper = len(self.present) if end is None else max(0, self.offset_of(end) + 1)
+        return lower, min(upper, len(self.present))
+
+    def slice(self, start=None, end=None):
+        """Return the days from `start` to `end` inclusive, sharing this container's arrays."""
+        lower, upper = self._offset_range(start, end)
+        if lower >= upper:
+            return self.empty()
+        return self.__class__(
+            start_date=self.start_date + datetime.timedelta(days=lower),
+            present=self.present[lower:upper],
+            resting_heart_rate=self.resting_heart_rate[lower:upper],
+            zone_names=self.zone_names,
+            zones=self.zones[lower:upper],
+            custom_zones={
+                offset - lower: zones for offset, zones in self.custom_zones.items()
+                if lower <= offset < upper
+            },
+        )
 
-    def interval_timedelta(self):
-        return None
+    def dates(self):
+        if self.start_date is None:
+            return np.zeros(0, dtype='datetime64[D]')
+        return np.datetime64(self.start_date, 'D') + np.flatnonzero(self.present)
+
+    def resting_heart_rate_stats(self, start=None, end=None):
+        lower, upper = self._offset_range(start, end)
+        values = self.resting_heart_rate[lower:upper]
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return dict(count=0, mean=None, min=None, max=None)
+        return dict(count=len(values), mean=float(values.mean()), min=float(values.min()), max=float(values.max()))
+
+    def zone_minutes_total(self, start=None, end=None):
+        lower, upper = self._offset_range(start, end)
+        totals = np.nansum(self.zone_field('minutes')[lower:upper], axis=0)
+        return OrderedDict(zip(self.zone_names, totals.tolist()))
+
+    def __getitem__(self, date):
+        offset = self.offset_of(date)
+        if offset is None or not 0 <= offset < len(self.present) or not self.present[offset]:
+            raise KeyError(date)
+        return HeartrateResultView(self, offset)
+
+    def __iter__(self):
+        for offset in np.flatnonzero(self.present).tolist():
+            yield self.start_date + datetime.timedelta(days=offset)
+
+    def __len__(self):
+        return self._len
 
     def __repr__(self):
-        items = self.items()
-        if len(items) > 5:
-            itemsiter = iter(items)
-            items = []
-            for _ in range(5):
-                items.append(next(itemsiter))
-            items = repr(items)
-            items = items[:-1] + ', <...>' + items[-1]
-        else:
-            items = repr(list(items))
-        return '{}({})'.format(self.__class__.__name__, items)
+        return '{}(start_date={!r}, days={})'.format(self.__class__.__name__, self.start_date, len(self))
+
 
-    # def __eq__(self, other):
-    #     return (
-    #         other.interval == self._interval and
-    #         other.interval_type == self._interval_type and
-    #         super().__eq__(other)
-    #     )
-    #
-    # def __hash__(self):
-    #     return super().__hash__() + hash((
-    #         self._interval, self._interval_type
-    #     ))
+class IntradayHeartrateResults(IntradayTimeSeries):
 
-    # def get_subset(self, start_time=None, end_time=None):
+    __slots__ = ()
 
 
-class IntradayHeartrateEndpoint(ApiEndpoint):
+class IntradayHeartrateEndpoint(IntradayTimeSeriesEndpoint):
 
-    BASE_URL = 'user/-/activities/heart/date/'
+    NAME = 'intraday_heartrate'
+    RESOURCE = 'heart'
     DETAIL_LEVELS = ('1sec', '1min')
-    DATE_FORMAT = '%Y-%m-%d'
-    TIME_FORMAT = '%H:%M'
-
-    def __init__(self, *a, **k):
-        super().__init__(*a, **k)
-        assert self.api_base._user == '-'
-
-    def build_url(self, date, detail_level='1sec', end_date=None, start_time=None, end_time=None):
-        if end_date is not None:
-            if end_date == date:
-                # They point to the same day; so use the '1d' endpoint.
-                end_date = None
-            else:
-                # These are not valid for ranges of more than 1 day.
-                assert start_time is None
-                assert end_time is None
-        if start_time is not None and end_time is None:
-            warnings.warn('Giving `start_time` without `end_time` will not '
-                          'include data for 23:59:**', FitbitApiWarning)
-            end_time = datetime.time.max
-        elif end_time is not None and start_time is None:
-            start_time = datetime.time.min
-        assert detail_level in self.DETAIL_LEVELS
-
-        url_parts = [date.strftime(self.DATE_FORMAT)]
-        if end_date:
-            url_parts.append(end_date.strftime(self.DATE_FORMAT))
-        else:
-            url_parts.append('1d')
-        url_parts.append(detail_level)
-        if start_time:
-            url_parts.append('time')
-            url_parts.append(start_time.strftime(self.TIME_FORMAT))
-            url_parts.append(end_time.strftime(self.TIME_FORMAT))
-        return super().build_url(url_parts)
+    VALUE_DTYPE = np.uint16
+    SERIES_CLASS = IntradayHeartrateResults
 
     def parse_response_json(self, response_json):
-        intraday_results = None
-        if 'activities-heart-intraday' in response_json:
-            intraday_results = IntradayHeartrateResults.build_from_response(response_json['activities-heart-intraday'])
+        heartrate_results = None
         if 'activities-heart' in response_json:
             heartrate_results = HeartrateResults.build_from_response(response_json['activities-heart'])
         return (
             heartrate_results,
-            intraday_results
+            self.parse_intraday(response_json),
         )
 
+    def freeze_result(self, result):
+        heartrate_results, intraday = result
+        if heartrate_results is not None:
+            heartrate_results.freeze()
+        super().freeze_result(intraday)
+
 
 class Heartrate(ApiBase):
 
@@ -0,0 +1,119 @@
+import json
+import re
+
+import numpy as np
+
+
+_TIME_LENGTH = len('HH:MM:SS')
+_ZERO = ord('0')
+
+
+def parse_time_buffer(buffer):
+    """Convert concatenated 'HH:MM:SS' strings into seconds since midnight."""
+    raw = np.frombuffer(buffer, dtype=np.uint8)
+    if raw.size % _TIME_LENGTH:
+        raise ValueError('Times must all be in the form HH:MM:SS')
+    digits = raw.reshape(-1, _TIME_LENGTH).astype(np.int32) - _ZERO
+    hours = digits[:, 0] * 10 + digits[:, 1]
+    minutes = digits[:, 3] * 10 + digits[:, 4]
+    seconds = digits[:, 6] * 10 + digits[:, 7]
+    return hours * 3600 + minutes * 60 + seconds
+
+
+_DATASET_START = re.compile(rb'"dataset"\s*:\s*\[')
+_DATASET_ENTRY = re.compile(
+    rb'\{\s*"time"\s*:\s*"(\d\d:\d\d:\d\d)"\s*,\s*"value"\s*:\s*([-+.eE0-9]+)\s*\}'
+)
+
+
+class StreamingIntradayDecoder():
+    """Incrementally decodes an intraday response, one chunk at a time.
+
+    The samples in `<response_key>.dataset` are written straight into
+    preallocated arrays instead of being built into a list of dicts. The
+    rest of the document, which is small, is kept with an empty dataset
+    and parsed with `json` once the response has been read.
+    """
+
+    def __init__(self, response_key, capacity=86400, dtype=np.float64):
+        self.key = b'"' + response_key.encode('utf-8') + b'"'
+        self.seconds = np.empty(capacity, dtype=np.int32)
+        self.values = np.empty(capacity, dtype=dtype)
+        self.count = 0
+        self._state = 'prefix'
+        self._skeleton = bytearray()
+        self._pending = bytearray()
+
+    def feed(self, chunk):
+        self._pending.extend(chunk)
+        if self._state == 'prefix':
+            self._scan_prefix()
+        if self._state == 'dataset':
+            self._scan_dataset()
+        if self._state == 'suffix':
+            self._skeleton.extend(self._pending)
+            self._pending.clear()
+
+    def close(self):
+        """Return (document, seconds, values) once all chunks have been fed."""
+        if self._state == 'dataset':
+            raise ValueError('Response ended inside the intraday dataset')
+        self._skeleton.extend(self._pending)
+        self._pending.clear()
+        document = json.loads(self._skeleton.decode('utf-8'))
+        seconds = self.seconds[:self.count]
+        values = self.values[:self.count]
+        if self.count < len(self.seconds) // 2:
+            # Don't hold on to a mostly empty allocation.
+            seconds, values = seconds.copy(), values.copy()
+        return document, seconds, values
+
+    def _scan_prefix(self):
+        pending = self._pending
+        key_at = pending.find(self.key)
+        if key_at < 0:
+            # Keep enough of the tail to find a key split across chunks.
+            keep = len(pending) - len(self.key)
+            if keep > 0:
+                self._skeleton.extend(pending[:keep])
+                del pending[:keep]
+            return
+        match = _DATASET_START.search(pending, key_at)
+        if match is None:
+            self._skeleton.extend(pending[:key_at])
+            del pending[:key_at]
+            return
+        self._skeleton.extend(pending[:match.end()])
+        del pending[:match.end()]
+        self._state = 'dataset'
+
+    def _scan_dataset(self):
+        pending = self._pending
+        dataset_end = pending.find(b']')
+        if dataset_end >= 0:
+            region_end = dataset_end
+        else:
+            # Only decode whole entries; the rest waits for the next chunk.
+            region_end = pending.rfind(b'}') + 1
+        if region_end > 0:
+            region = bytes(pending[:region_end])
+            entries = _DATASET_ENTRY.findall(region)
+            if region.count(b'{') != len(entries):
+                raise ValueError('Unexpected intraday dataset entry near %r' % (region[:80], ))
+            if entries:
+                self._append(entries)
+            del pending[:region_end]
+        if dataset_end >= 0:
+            self._state = 'suffix'
+
+    def _append(self, entries):
+        count = len(entries)
+        end = self.count + count
+        if end > len(self.seconds):
+            capacity = max(end, 2 * len(self.seconds))
+            self.seconds = np.resize(self.seconds, capacity)
+            self.values = np.resize(self.values, capacity)
+        self.seconds[self.count:end] = parse_time_buffer(b''.join([time for time, _ in entries]))
+        values = np.array([value for _, value in entries], dtype=np.bytes_).astype(np.float64)
+        self.values[self.count:end] = values
+        self.count = end
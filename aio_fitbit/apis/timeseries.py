@@ -0,0 +1,214 @@
+import asyncio
+from collections.abc import ItemsView, Mapping
+import datetime
+import warnings
+
+import numpy as np
+
+from aio_fitbit.apis._base import ApiEndpoint
+from aio_fitbit.apis.streaming import parse_time_buffer, StreamingIntradayDecoder
+from aio_fitbit.exceptions import FitbitApiWarning
+
+
+def decode_intraday_dataset(dataset, dtype=np.float64):
+    """Decode a list of `{"time", "value"}` dicts into (seconds, values) arrays."""
+    if not dataset:
+        return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=dtype)
+    times = ''.join([entry['time'] for entry in dataset]).encode('ascii')
+    values = np.array([entry['value'] for entry in dataset], dtype=dtype)
+    return parse_time_buffer(times), values
+
+
+def _seconds_to_time(seconds):
+    return datetime.time(seconds // 3600, seconds // 60 % 60, seconds % 60)
+
+
+class IntradayItemsView(ItemsView):
+
+    __slots__ = ()
+
+    def __iter__(self):
+        # Walk the arrays together, rather than looking up each time.
+        return zip(self._mapping, self._mapping.values.tolist())
+
+
+class IntradayTimeSeries(Mapping):
+    """Maps `datetime.time` to sample values, stored as two parallel arrays."""
+
+    __slots__ = ('seconds', 'values', '_interval', '_interval_type')
+
+    @classmethod
+    def build_from_response(cls, intraday_response_dict, dtype=np.float64):
+        seconds, values = decode_intraday_dataset(intraday_response_dict.get('dataset', []), dtype)
+        return cls(
+            seconds=seconds,
+            values=values,
+            interval=intraday_response_dict['datasetInterval'],
+            interval_type=intraday_response_dict['datasetType'],
+        )
+
+    def __init__(self, seconds, values, interval, interval_type):
+        if len(seconds) != len(values):
+            raise ValueError('`seconds` and `values` must be the same length')
+        self.seconds = seconds
+        self.values = values
+        self._interval = interval
+        self._interval_type = interval_type
+
+    @property
+    def interval(self):
+        return self._interval
+
+    @property
+    def interval_type(self):
+        return self._interval_type
+
+    def freeze(self):
+        """Make the arrays read only, so the series can be shared."""
+        self.seconds.flags.writeable = False
+        self.values.flags.writeable = False
+
+    def interval_timedelta(self):
+        return datetime.timedelta(**{self._interval_type + 's': self._interval})
+
+    def datetimes(self, date):
+        """Return the sample times on `date` as a `datetime64[s]` array."""
+        return np.datetime64(date, 's') + self.seconds.astype('timedelta64[s]')
+
+    def __getitem__(self, time):
+        key = time.hour * 3600 + time.minute * 60 + time.second
+        idx = np.searchsorted(self.seconds, key)
+        if idx < len(self.seconds) and self.seconds[idx] == key:
+            return self.values[idx].item()
+        raise KeyError(time)
+
+    def __iter__(self):
+        return map(_seconds_to_time, self.seconds.tolist())
+
+    def __len__(self):
+        return len(self.seconds)
+
+    def items(self):
+        return IntradayItemsView(self)
+
+    def __repr__(self):
+        items = list(zip(map(_seconds_to_time, self.seconds[:6].tolist()), self.values[:6].tolist()))
+        if len(self) > 5:
+            items = repr(items[:5])
+            items = items[:-1] + ', <...>' + items[-1]
+        else:
+            items = repr(items)
+        return '{}({})'.format(self.__class__.__name__, items)
+
+
+class IntradayTimeSeriesEndpoint(ApiEndpoint):
+
+    RESOURCE = None
+    DETAIL_LEVELS = ('1min', '15min')
+    VALUE_DTYPE = np.float64
+    SERIES_CLASS = IntradayTimeSeries
+    DATE_FORMAT = '%Y-%m-%d'
+    TIME_FORMAT = '%H:%M'
+    SAMPLES_PER_DAY = {'1sec': 86400, '1min': 1440, '15min': 96}
+    CHUNK_SIZE = 2 ** 16
+    # Set per call by `build_url` and `parse_response`.
+    _expected_samples = 86400
+    _streamed_dataset = None
+    URL_TEMPLATES = {
+        'day': 'user/{user}/activities/{resource}/date/{date}/1d/{detail_level}.json',
+        'range': 'user/{user}/activities/{resource}/date/{date}/{end_date}/{detail_level}.json',
+        'time': 'user/{user}/activities/{resource}/date/{date}/1d/{detail_level}/time/{start_time}/{end_time}.json',
+    }
+
+    def build_url(self, date, detail_level=None, end_date=None, start_time=None, end_time=None):
+        if detail_level is None:
+            detail_level = self.DETAIL_LEVELS[0]
+        if end_date is not None:
+            if end_date == date:
+                # They point to the same day; so use the '1d' endpoint.
+                end_date = None
+            else:
+                # These are not valid for ranges of more than 1 day.
+                assert start_time is None
+                assert end_time is None
+        if start_time is not None and end_time is None:
+            warnings.warn('Giving `start_time` without `end_time` will not '
+                          'include data for 23:59:**', FitbitApiWarning)
+            end_time = datetime.time.max
+        elif end_time is not None and start_time is None:
+            start_time = datetime.time.min
+        assert detail_level in self.DETAIL_LEVELS
+        # Size the arrays for the streaming decoder to fit the whole response.
+        days = (end_date - date).days + 1 if end_date else 1
+        self._expected_samples = days * self.SAMPLES_PER_DAY.get(detail_level, 1440)
+
+        values = dict(
+            user=self.api_base._user,
+            resource=self.RESOURCE,
+            date=date.strftime(self.DATE_FORMAT),
+            detail_level=detail_level,
+        )
+        if end_date:
+            return self.expand_url('range', end_date=end_date.strftime(self.DATE_FORMAT), **values)
+        elif start_time:
+            return self.expand_url(
+                'time',
+                start_time=start_time.strftime(self.TIME_FORMAT),
+                end_time=end_time.strftime(self.TIME_FORMAT),
+                **values
+            )
+        else:
+            return self.expand_url('day', **values)
+
+    def is_cacheable(self, date, detail_level=None, end_date=None, start_time=None, end_time=None):
+        last_date = end_date or date
+        if isinstance(last_date, datetime.datetime):
+            last_date = last_date.date()
+        # Samples for today are still arriving.
+        return last_date < datetime.date.today()
+
+    def freeze_result(self, result):
+        if result is not None:
+            result.freeze()
+
+    @property
+    def response_key(self):
+        return 'activities-{}-intraday'.format(self.RESOURCE)
+
+    @asyncio.coroutine
+    def parse_response(self, response):
+        if response.status >= 400:
+            # Error bodies are small, and have already been read.
+            return (yield from super().parse_response(response))
+        decoder = StreamingIntradayDecoder(
+            self.response_key,
+            capacity=self._expected_samples,
+            dtype=self.VALUE_DTYPE,
+        )
+        while True:
+            chunk = yield from response.content.read(self.CHUNK_SIZE)
+            if not chunk:
+                break
+            decoder.feed(chunk)
+        response_json, seconds, values = decoder.close()
+        if 'errors' in response_json:
+            raise ValueError("Fitbit indicated request failed." + repr(response_json))
+        self._streamed_dataset = (seconds, values)
+        return self.parse_response_json(response_json)
+
+    def parse_intraday(self, response_json):
+        if self.response_key not in response_json:
+            return None
+        intraday = response_json[self.response_key]
+        if self._streamed_dataset is None:
+            return self.SERIES_CLASS.build_from_response(intraday, self.VALUE_DTYPE)
+        seconds, values = self._streamed_dataset
+        return self.SERIES_CLASS(
+            seconds=seconds,
+            values=values,
+            interval=intraday['datasetInterval'],
+            interval_type=intraday['datasetType'],
+        )
+
+    def parse_response_json(self, response_json):
+        return self.parse_intraday(response_json)
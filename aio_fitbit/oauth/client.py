@@ -1,11 +1,15 @@
 import asyncio
+import functools
+import time
 
 from aioauth_client import OAuth2Client
-from aiohttp import BasicAuth, request as aiorequest
+from aiohttp import BasicAuth
 
 from aio_fitbit import API_VERSION
 from aio_fitbit.exceptions import FitbitApiException
 from aio_fitbit.oauth import ALL_SCOPES
+from aio_fitbit.stats import LatencyTracker, TransferStats
+from aio_fitbit.transport import AiohttpTransport, DecodedResponse
 
 
 class FitbitOauth2Client(OAuth2Client):
@@ -18,6 +22,18 @@ class FitbitOauth2Client(OAuth2Client):
 
     DEFAULT_SCOPES = ALL_SCOPES
 
+    # A `RequestScheduler` to queue requests through; `None` to send them straight away.
+    scheduler = None
+    # Sends the HTTP requests; see `aio_fitbit.transport` for recording and replaying them.
+    transport = None
+    # Per endpoint `TransferStats` and `LatencyTracker`; created on first use.
+    stats = None
+    latency = None
+    # Percentile of the endpoint's latency to wait for before hedging, and
+    # the delay to use until enough latencies have been seen.
+    HEDGE_PERCENTILE = 95
+    HEDGE_DEFAULT_DELAY = 2.0
+
     def __init__(self, *a, **k):
         # Provide default FitBit scope.
         super().__init__(*a, **k)
@@ -60,15 +76,31 @@ class FitbitOauth2Client(OAuth2Client):
         print("Handled Error Response:", should_retry)
         return should_retry
 
-    def request(self, *args, timeout=10, loop=None, **kwargs):
-        """Request OAuth2 resource."""
-        # Enforce the timeout outside of the error checking/retry cycle.
-        return asyncio.wait_for(self._request(*args, **kwargs), timeout, loop=loop)
+    @asyncio.coroutine
+    def request(self, *args, timeout=10, loop=None, priority=None, hedge=False, **kwargs):
+        """Request OAuth2 resource.
+
+        With `hedge`, a duplicate request is sent if the response is slow
+        to start; see `_do_hedged_request`.
+        """
+        kwargs.update(priority=priority, hedge=hedge)
+        if self.scheduler is None:
+            # Enforce the timeout outside of the error checking/retry cycle.
+            return (yield from asyncio.wait_for(self._request(*args, **kwargs), timeout, loop=loop))
+        # Wait for a slot before starting the timeout, so queued low priority
+        # requests don't time out while higher priority ones go ahead of them.
+        yield from self.scheduler.acquire(priority)
+        try:
+            return (yield from asyncio.wait_for(self._request(*args, **kwargs), timeout, loop=loop))
+        finally:
+            self.scheduler.release()
 
     @asyncio.coroutine
-    def _request(self, method, url, params=None, headers=None, loop=None, **aio_kwargs):
+    def _request(self, method, url, params=None, headers=None, loop=None, endpoint=None,
+                 priority=None, hedge=False, **aio_kwargs):
         url = self._get_url(url)
         print('FitbitOauth2Client._request', url)
+        transport = self.get_transport()
         should_retry = True
         while should_retry:
             print("Retrying ", method, url)
@@ -83,10 +115,14 @@ class FitbitOauth2Client(OAuth2Client):
                     'Accept': 'application/json',
                     'Content-Type': 'application/x-www-form-urlencoded;charset=UTF-8',
                 }
-            response = yield from self._do_request(
-                method, url, params=params, headers=headers,
-                auth=auth, loop=loop, **aio_kwargs
-            )
+            if transport.accept_encoding:
+                headers.setdefault('Accept-Encoding', transport.accept_encoding)
+            request_kwargs = dict(params=params, headers=headers, auth=auth, loop=loop, **aio_kwargs)
+            if hedge:
+                response = yield from self._do_hedged_request(endpoint, priority, method, url, **request_kwargs)
+            else:
+                response = yield from self._do_timed_request(endpoint, method, url, **request_kwargs)
+            response = self.decode_response(response, endpoint)
             if response.status < 400:
                 return response
             should_retry = yield from self._handle_error_response(response)
@@ -96,6 +132,90 @@ class FitbitOauth2Client(OAuth2Client):
                 return response
             response.close()
 
+    @asyncio.coroutine
+    def _do_timed_request(self, endpoint, method, url, **aio_kwargs):
+        start = time.monotonic()
+        try:
+            response = yield from self._do_request(method, url, **aio_kwargs)
+        except asyncio.CancelledError:
+            # A hedged request that lost, or a request that timed out. Its
+            # time so far is a lower bound on the latency, and leaving it out
+            # would hide the slow requests the hedge delay is set from.
+            self.get_latency().record(endpoint, time.monotonic() - start)
+            raise
+        self.get_latency().record(endpoint, time.monotonic() - start)
+        return response
+
+    @asyncio.coroutine
+    def _do_hedged_request(self, endpoint, priority, method, url, **aio_kwargs):
+        """Send a second copy of a request that is slower than usual to respond.
+
+        Once the endpoint's HEDGE_PERCENTILE latency has passed without
+        response headers, the request is sent again on another connection,
+        if the scheduler can spare the quota and a concurrent request. The
+        first success is used and the other request is cancelled.
+        """
+        delay = self.get_latency().percentile(endpoint, self.HEDGE_PERCENTILE) or self.HEDGE_DEFAULT_DELAY
+        primary = asyncio.ensure_future(self._do_timed_request(endpoint, method, url, **aio_kwargs))
+        secondary = None
+        winner = None
+        try:
+            done, _ = yield from asyncio.wait([primary], timeout=delay)
+            if done or self.scheduler is None or not self.scheduler.try_acquire_hedge(priority):
+                response = yield from primary
+                winner = primary
+                return response
+            secondary = asyncio.ensure_future(self._do_timed_request(endpoint, method, url, **aio_kwargs))
+            pending = {primary, secondary}
+            while pending and winner is None:
+                done, pending = yield from asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    if winner is None and not future.cancelled() and future.exception() is None:
+                        winner = future
+            if winner is None:
+                # Both failed; raise the original request's error.
+                return (yield from primary)
+            return winner.result()
+        finally:
+            # Also reached when the call itself is cancelled, e.g. by its timeout.
+            for future in (primary, secondary):
+                if future is None or future is winner:
+                    continue
+                if not future.done():
+                    future.cancel()
+                elif not future.cancelled() and future.exception() is None:
+                    future.result().close()
+            if secondary is not None:
+                self.scheduler.release_hedge()
+
+    def decode_response(self, response, endpoint=None):
+        """Wrap a transport's response so its body is decompressed as it is read."""
+        # Transports that already decode the body are treated as uncompressed.
+        encoding = None if self.get_transport().accept_encoding else 'identity'
+        on_complete = functools.partial(self.get_stats().record, endpoint or 'other')
+        return DecodedResponse(response, encoding=encoding, on_complete=on_complete)
+
+    def get_latency(self):
+        if self.latency is None:
+            self.latency = LatencyTracker()
+        return self.latency
+
+    def get_stats(self):
+        if self.stats is None:
+            self.stats = TransferStats()
+        return self.stats
+
+    @asyncio.coroutine
+    def close(self):
+        """Close the transport's connections; call once the client is finished with."""
+        if self.transport is not None:
+            yield from self.transport.close()
+
+    def get_transport(self):
+        if self.transport is None:
+            self.transport = AiohttpTransport()
+        return self.transport
+
     def _do_request(self, method, url, **aio_kwargs):
         print(method, url)
-        return aiorequest(method, url, **aio_kwargs)
+        return self.get_transport().request(method, url, **aio_kwargs)
@@ -0,0 +1,134 @@
+import asyncio
+from collections import namedtuple
+import datetime
+import heapq
+import itertools
+
+from aio_fitbit.exceptions import FitbitApiLimitExceededException
+
+
+# `rank` orders the classes; lower ranks are dispatched first. `reserved` is
+# the number of requests in each hourly window that lower priority classes
+# are not allowed to use.
+PriorityClass = namedtuple('PriorityClass', ('name', 'rank', 'reserved'))
+
+DEFAULT_PRIORITY_CLASSES = (
+    PriorityClass('interactive', 0, 10),
+    PriorityClass('default', 10, 0),
+    PriorityClass('backfill', 20, 0),
+)
+
+
+class RequestScheduler():
+
+    def __init__(self, priority_classes=DEFAULT_PRIORITY_CLASSES, *,
+                 max_concurrent=8, default_priority='default', max_hedge_fraction=0.05):
+        self.priority_classes = {}
+        for priority_class in priority_classes:
+            self.priority_classes[priority_class.name] = PriorityClass._make(priority_class)
+        if default_priority not in self.priority_classes:
+            raise ValueError('Unknown default priority %r' % (default_priority, ))
+        self.default_priority = default_priority
+        self.max_concurrent = max_concurrent
+        self.remaining = None
+        self.reset = None
+        # At most this fraction of the remaining quota is spent on hedged requests, per window.
+        self.max_hedge_fraction = max_hedge_fraction
+        self.hedges_this_window = 0
+        self._active = 0
+        self._waiters = []
+        self._counter = itertools.count()
+
+    def get_priority_class(self, priority=None):
+        if priority is None:
+            priority = self.default_priority
+        if isinstance(priority, PriorityClass):
+            return priority
+        try:
+            return self.priority_classes[priority]
+        except KeyError:
+            raise ValueError('Unknown priority class %r' % (priority, )) from None
+
+    def reserved_above(self, priority_class):
+        return sum(
+            other.reserved for other in self.priority_classes.values()
+            if other.rank < priority_class.rank
+        )
+
+    def available_quota(self, now=None):
+        """Return the number of requests left in this window, or None if unknown."""
+        now = now or datetime.datetime.now()
+        if self.remaining is None or self.reset is None or self.reset <= now:
+            # Either we haven't seen a response yet or the window has reset.
+            return None
+        return self.remaining - self._active
+
+    def update_usage(self, remaining, reset):
+        if self.reset is None or reset is None or reset > self.reset + datetime.timedelta(minutes=1):
+            # A new rate limit window.
+            self.hedges_this_window = 0
+        self.remaining = remaining
+        self.reset = reset
+
+    def check_quota(self, priority_class):
+        available = self.available_quota()
+        if available is None:
+            return
+        if available <= self.reserved_above(priority_class):
+            raise FitbitApiLimitExceededException(
+                'Precheck failed for %r requests, retry at %s' % (priority_class.name, self.reset))
+
+    @asyncio.coroutine
+    def acquire(self, priority=None):
+        priority_class = self.get_priority_class(priority)
+        if self._active < self.max_concurrent and not self._waiters:
+            self.check_quota(priority_class)
+            self._active += 1
+            return priority_class
+        waiter = asyncio.Future()
+        heapq.heappush(self._waiters, (priority_class.rank, next(self._counter), priority_class, waiter))
+        try:
+            yield from waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled() and waiter.exception() is None:
+                # We were given a slot just before being cancelled; pass it on.
+                self.release()
+            raise
+        return priority_class
+
+    def release(self):
+        self._active -= 1
+        self._wake_waiters()
+
+    def try_acquire_hedge(self, priority=None):
+        """Reserve quota for a duplicate request, without waiting; False if it can't be spared."""
+        if self._active >= self.max_concurrent or self._waiters:
+            # Hedges never take a slot another request is waiting for.
+            return False
+        priority_class = self.get_priority_class(priority)
+        available = self.available_quota()
+        if available is None or available <= self.reserved_above(priority_class):
+            # Only hedge when we know there is quota to spare.
+            return False
+        if self.hedges_this_window >= int(self.max_hedge_fraction * self.remaining):
+            return False
+        self.hedges_this_window += 1
+        self._active += 1
+        return True
+
+    def release_hedge(self):
+        self.release()
+
+    def _wake_waiters(self):
+        while self._waiters and self._active < self.max_concurrent:
+            _, _, priority_class, waiter = heapq.heappop(self._waiters)
+            if waiter.done():
+                # Cancelled while queued.
+                continue
+            try:
+                self.check_quota(priority_class)
+            except FitbitApiLimitExceededException as e:
+                waiter.set_exception(e)
+                continue
+            self._active += 1
+            waiter.set_result(None)
@@ -1,7 +1,9 @@
 import asyncio
 from collections import namedtuple
 import datetime
+import os
 import pathlib
+import socket
 
 import aiohttp
 import yaml
@@ -9,28 +11,38 @@ import yaml
 from aio_fitbit.oauth.client import FitbitOauth2Client
 from aio_fitbit.oauth.utils import get_user_credentials
 from aio_fitbit.exceptions import FitbitApiLimitExceededException
+from aio_fitbit.scheduler import RequestScheduler
+from aio_fitbit.sqlite import from_timestamp, SqliteDatabase, to_timestamp
 
 
 def find_secret_file(cwd, valid_filenames=('.fitbit.secret', '.fitbit.secret.yaml'), multicase=True):
     cwd = pathlib.Path(cwd).resolve()
-    if multicase:
-        valid_filenames = frozenset(name.lower() for name in valid_filenames)
-    else:
-        valid_filenames = frozenset(valid_filenames)
+    lower_filenames = frozenset(name.lower() for name in valid_filenames)
+    # The nearest directory with a match wins.
     for path in [cwd] + list(cwd.parents):
-        for file in path.iterdir():
+        # Try the exact names first; that is a stat per name instead of
+        # listing the directory.
+        for name in valid_filenames:
+            file = path / name
             if file.is_file():
-                name = file.name
-                if multicase:
-                    name = name.lower()
-                if name in valid_filenames:
-                    return file
+                return file
+        if not multicase:
+            continue
+        for file in path.iterdir():
+            if file.is_file() and file.name.lower() in lower_filenames:
+                return file
     return None
 
 
-def parse_secret_file(filename):
+SQLITE_SUFFIXES = ('.db', '.sqlite', '.sqlite3')
+
+
+def parse_secret_file(filename, user_id='-'):
     filename = pathlib.Path(filename)
-    data = SecretsFile(filename)
+    if filename.suffix.lower() in SQLITE_SUFFIXES:
+        data = SqliteSecretsDatabase(filename).store_for(user_id)
+    else:
+        data = SecretsFile(filename)
     data.load()
     return data
 
@@ -45,10 +57,14 @@ ApiUsage = namedtuple('ApiUsage', ('remaining', 'reset'))
 ApiUsage.EMPTY = ApiUsage(0, datetime.datetime.fromtimestamp(0))
 
 
-class SecretsFile():
+class SecretsStore():
+    """Holds one user's client secrets, credentials and API usage.
 
-    def __init__(self, filename):
-        self.filename = str(filename)
+    Subclasses implement `load` and `save` for a storage backend, and can
+    override the narrower `save_*` methods to avoid rewriting everything.
+    """
+
+    def __init__(self):
         self._client_secrets = ClientSecrets.EMPTY
         self._user_credentials = UserCredentials.EMPTY
         self._api_usage = ApiUsage.EMPTY
@@ -90,13 +106,46 @@ class SecretsFile():
         else:
             self._api_usage = ApiUsage._make(secrets)
 
-    def create_oauth_client(self):
-        return SecretsBackedFitbitApiClient(self)
+    def create_oauth_client(self, **kwargs):
+        return SecretsBackedFitbitApiClient(self, **kwargs)
 
     def ensure_loaded(self):
         if not self._is_loaded:
             self.load()
 
+    def load(self):
+        raise NotImplementedError()
+
+    def save(self):
+        raise NotImplementedError()
+
+    def save_user_credentials(self):
+        self.save()
+
+    def save_api_usage(self):
+        self.save()
+
+    def reload_user_credentials(self):
+        self.load()
+
+    def reload_api_usage(self):
+        """Return the latest API usage, which other processes may have updated."""
+        return self.api_usage
+
+    def claim_token_refresh(self, owner, lease_seconds):
+        """Claim the right to refresh the user's token; False if someone else holds it."""
+        return True
+
+    def release_token_refresh(self, owner):
+        pass
+
+
+class SecretsFile(SecretsStore):
+
+    def __init__(self, filename):
+        super().__init__()
+        self.filename = str(filename)
+
     def load(self, filename=None):
         if filename is None:
             filename = self.filename
@@ -123,11 +172,174 @@ class SecretsFile():
             yaml.safe_dump(data, file)
 
 
+class SqliteSecretsDatabase(SqliteDatabase):
+    """Secrets for many users of one client, in a SQLite database.
+
+    Several processes can share the file; each user's rows are updated in
+    place within short `BEGIN IMMEDIATE` transactions.
+    """
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS client (
+            id TEXT PRIMARY KEY,
+            secret TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS user (
+            user_id TEXT PRIMARY KEY,
+            client_id TEXT NOT NULL REFERENCES client(id),
+            access_token TEXT NOT NULL DEFAULT '',
+            refresh_token TEXT NOT NULL DEFAULT '',
+            expiry REAL NOT NULL DEFAULT 0,
+            scopes TEXT NOT NULL DEFAULT '',
+            refresh_owner TEXT,
+            refresh_lease_until REAL
+        );
+        CREATE TABLE IF NOT EXISTS api_usage (
+            user_id TEXT PRIMARY KEY REFERENCES user(user_id),
+            remaining INTEGER NOT NULL,
+            reset REAL NOT NULL
+        );
+    '''
+
+    def store_for(self, user_id):
+        return SqliteSecretsStore(self, user_id)
+
+    def add_user(self, user_id, client_secrets, user_credentials=UserCredentials.EMPTY):
+        store = self.store_for(user_id)
+        store.client_secrets = client_secrets
+        store.user_credentials = user_credentials
+        # Nothing to load for a new user.
+        store._is_loaded = True
+        store.save()
+        return store
+
+    def user_ids(self):
+        return [row[0] for row in self.connection.execute('SELECT user_id FROM user ORDER BY user_id')]
+
+
+class SqliteSecretsStore(SecretsStore):
+
+    def __init__(self, database, user_id):
+        super().__init__()
+        self.database = database
+        self.user_id = user_id
+
+    def load(self):
+        row = self.database.connection.execute(
+            'SELECT client.id, client.secret, '
+            '       user.access_token, user.refresh_token, user.expiry, user.scopes, '
+            '       api_usage.remaining, api_usage.reset '
+            'FROM user JOIN client ON client.id = user.client_id '
+            'LEFT JOIN api_usage ON api_usage.user_id = user.user_id '
+            'WHERE user.user_id = ?',
+            (self.user_id, )
+        ).fetchone()
+        if row is None:
+            raise KeyError('No secrets stored for user %r' % (self.user_id, ))
+        client_id, client_secret, access_token, refresh_token, expiry, scopes, remaining, reset = row
+        self.client_secrets = ClientSecrets(client_id, client_secret)
+        self.user_credentials = UserCredentials(
+            access_token, refresh_token, from_timestamp(expiry), tuple(scopes.split()))
+        if remaining is None:
+            self.api_usage = ApiUsage.EMPTY
+        else:
+            self.api_usage = ApiUsage(remaining, from_timestamp(reset))
+        self._is_loaded = True
+
+    def save(self):
+        client = self.client_secrets
+        with self.database.transaction() as connection:
+            connection.execute(
+                'INSERT INTO client (id, secret) VALUES (?, ?) '
+                'ON CONFLICT(id) DO UPDATE SET secret = excluded.secret',
+                (client.id, client.secret)
+            )
+            connection.execute(
+                'INSERT INTO user (user_id, client_id) VALUES (?, ?) '
+                'ON CONFLICT(user_id) DO UPDATE SET client_id = excluded.client_id',
+                (self.user_id, client.id)
+            )
+            self._update_user_credentials(connection)
+            self._update_api_usage(connection)
+
+    def save_user_credentials(self):
+        with self.database.transaction() as connection:
+            self._update_user_credentials(connection)
+
+    def save_api_usage(self):
+        with self.database.transaction() as connection:
+            self._update_api_usage(connection)
+
+    def reload_user_credentials(self):
+        row = self.database.connection.execute(
+            'SELECT access_token, refresh_token, expiry, scopes FROM user WHERE user_id = ?',
+            (self.user_id, )
+        ).fetchone()
+        access_token, refresh_token, expiry, scopes = row
+        self.user_credentials = UserCredentials(
+            access_token, refresh_token, from_timestamp(expiry), tuple(scopes.split()))
+
+    def reload_api_usage(self):
+        row = self.database.connection.execute(
+            'SELECT remaining, reset FROM api_usage WHERE user_id = ?',
+            (self.user_id, )
+        ).fetchone()
+        if row is not None:
+            self.api_usage = ApiUsage(row[0], from_timestamp(row[1]))
+        return self.api_usage
+
+    def claim_token_refresh(self, owner, lease_seconds):
+        now = datetime.datetime.now()
+        lease_until = now + datetime.timedelta(seconds=lease_seconds)
+        with self.database.transaction() as connection:
+            cursor = connection.execute(
+                'UPDATE user SET refresh_owner = ?, refresh_lease_until = ? '
+                'WHERE user_id = ? AND (refresh_owner IS NULL OR refresh_owner = ? OR refresh_lease_until < ?)',
+                (owner, to_timestamp(lease_until), self.user_id, owner, to_timestamp(now))
+            )
+            return cursor.rowcount == 1
+
+    def release_token_refresh(self, owner):
+        with self.database.transaction() as connection:
+            connection.execute(
+                'UPDATE user SET refresh_owner = NULL, refresh_lease_until = NULL '
+                'WHERE user_id = ? AND refresh_owner = ?',
+                (self.user_id, owner)
+            )
+
+    def _update_user_credentials(self, connection):
+        credentials = self.user_credentials
+        connection.execute(
+            'UPDATE user SET access_token = ?, refresh_token = ?, expiry = ?, scopes = ? '
+            'WHERE user_id = ?',
+            (credentials.access_token, credentials.refresh_token,
+             to_timestamp(credentials.expiry), ' '.join(credentials.scopes), self.user_id)
+        )
+
+    def _update_api_usage(self, connection):
+        usage = self.api_usage
+        connection.execute(
+            'INSERT INTO api_usage (user_id, remaining, reset) VALUES (?, ?, ?) '
+            'ON CONFLICT(user_id) DO UPDATE SET remaining = excluded.remaining, reset = excluded.reset',
+            (self.user_id, usage.remaining, to_timestamp(usage.reset))
+        )
+
+
 class SecretsBackedFitbitApiClient(FitbitOauth2Client):
 
-    def __init__(self, secret_store, action_on_expended_rate_limit='ignore'):
+    # How long a token refresh may take before another worker can take it over.
+    REFRESH_LEASE_SECONDS = 30
+
+    def __init__(self, secret_store, action_on_expended_rate_limit='ignore', scheduler=None, transport=None):
         self.secret_store = secret_store
+        self.transport = transport
         self.refresh_token_future = None
+        self.worker_id = '%s:%s:%x' % (socket.gethostname(), os.getpid(), id(self))
+        if scheduler is None:
+            scheduler = RequestScheduler()
+        self.scheduler = scheduler
+        usage = secret_store.api_usage
+        self.scheduler.update_usage(usage.remaining, usage.reset)
 
     @property
     def client_id(self):
@@ -141,6 +353,21 @@ class SecretsBackedFitbitApiClient(FitbitOauth2Client):
     def access_token(self):
         return self.secret_store.user_credentials.access_token
 
+    @property
+    def persists_secrets(self):
+        """Whether tokens and API usage from responses are saved to the store.
+
+        Never for replayed responses, which would overwrite the live tokens.
+        """
+        return not getattr(self.get_transport(), 'replaying', False)
+
+    @asyncio.coroutine
+    def request(self, *args, **kwargs):
+        # Other processes sharing the store may have used some of the quota.
+        usage = self.secret_store.reload_api_usage()
+        self.scheduler.update_usage(usage.remaining, usage.reset)
+        return (yield from super().request(*args, **kwargs))
+
     @asyncio.coroutine
     def _handle_error_response_single(self, err_type, error_data):
         if err_type == 'expired_token':
@@ -157,7 +384,33 @@ class SecretsBackedFitbitApiClient(FitbitOauth2Client):
             finally:
                 self.refresh_token_future = None
 
+    @asyncio.coroutine
     def _do_refresh_token(self):
+        stale_access_token = self.access_token
+        if not self.secret_store.claim_token_refresh(self.worker_id, self.REFRESH_LEASE_SECONDS):
+            # Another worker is refreshing this user's token; use theirs.
+            return (yield from self._wait_for_token_refresh(stale_access_token))
+        try:
+            self.secret_store.reload_user_credentials()
+            if self.access_token != stale_access_token:
+                # Refreshed by another worker before we got the claim.
+                return True
+            return (yield from self._request_token_refresh())
+        finally:
+            self.secret_store.release_token_refresh(self.worker_id)
+
+    @asyncio.coroutine
+    def _wait_for_token_refresh(self, stale_access_token, poll_interval=0.5):
+        deadline = datetime.datetime.now() + datetime.timedelta(seconds=self.REFRESH_LEASE_SECONDS)
+        while datetime.datetime.now() < deadline:
+            yield from asyncio.sleep(poll_interval)
+            self.secret_store.reload_user_credentials()
+            if self.access_token != stale_access_token:
+                return True
+        return False
+
+    @asyncio.coroutine
+    def _request_token_refresh(self):
         print("Refresh Token")
         method = 'POST'
         url = 'https://api.fitbit.com/oauth2/token'
@@ -167,32 +420,41 @@ class SecretsBackedFitbitApiClient(FitbitOauth2Client):
             'refresh_token': self.secret_store.user_credentials.refresh_token,
             'expires_in': '3600',
         }
+        headers = {}
+        transport = self.get_transport()
+        if transport.accept_encoding:
+            headers['Accept-Encoding'] = transport.accept_encoding
         auth_start_time = datetime.datetime.now()
-        response = yield from aiohttp.request(method, url, auth=auth, data=data)
+        response = yield from transport.request(method, url, auth=auth, data=data, headers=headers)
+        # aiohttp asks for a compressed response even when we don't.
+        response = self.decode_response(response, 'token_refresh')
         print("REFRESH TOKEN", response)
         response_json = yield from response.json()
         print(response_json)
         if response.status >= 400:
             # Refreshing the token failed.
             return False
+        if not self.persists_secrets:
+            # A replayed refresh; the store's tokens are the live ones.
+            return True
         resp_json = yield from response.json()
         self.secret_store.user_credentials = get_user_credentials(resp_json, auth_start=auth_start_time)
-        self.secret_store.save()
+        self.secret_store.save_user_credentials()
         return True
 
     @asyncio.coroutine
     def _do_request(self, *args, **kwargs):
+        # The remaining quota is prechecked by the scheduler, per priority class.
         req_start = datetime.datetime.now()
-        if (self.secret_store.api_usage.remaining < 10 and
-                self.secret_store.api_usage.reset > req_start):
-            raise FitbitApiLimitExceededException('Precheck failed, retry at %s' % self.secret_store.api_usage.reset)
         response = yield from super()._do_request(*args, **kwargs)
         if ('Fitbit-Rate-Limit-Remaining' in response.headers and
                 'Fitbit-Rate-Limit-Reset' in response.headers):
             remaining = int(response.headers['Fitbit-Rate-Limit-Remaining'])
             reset = datetime.timedelta(seconds=int(response.headers['Fitbit-Rate-Limit-Reset']))
-            self.secret_store.api_usage = ApiUsage(remaining, req_start + reset)
-            self.secret_store.save()
+            self.scheduler.update_usage(remaining, req_start + reset)
+            if self.persists_secrets:
+                self.secret_store.api_usage = ApiUsage(remaining, req_start + reset)
+                self.secret_store.save_api_usage()
         if response.status == 429:
             response.close()
             print('_do_request', response.headers)
@@ -0,0 +1,65 @@
+import contextlib
+import datetime
+import sqlite3
+
+
+def to_timestamp(value):
+    return value.timestamp()
+
+
+def from_timestamp(value):
+    return datetime.datetime.fromtimestamp(value)
+
+
+class SqliteDatabase():
+    """A SQLite file shared by several processes.
+
+    Subclasses give the `SCHEMA` to create. Writes should be made inside
+    `transaction()`, which holds the write lock for its duration.
+
+    The default 'wal' journal lets readers carry on while a write is made,
+    but needs shared memory, so every process must be on the same host.
+    When processes on several hosts share the file over a network
+    filesystem, use the 'delete' (rollback) journal instead; that also
+    relies on the filesystem's locks working, which not all do.
+    """
+
+    SCHEMA = ''
+
+    def __init__(self, filename, timeout=30, journal_mode='wal'):
+        self.filename = str(filename)
+        self.timeout = timeout
+        self.journal_mode = journal_mode.lower()
+        self._connection = None
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            connection = sqlite3.connect(self.filename, timeout=self.timeout, isolation_level=None)
+            (journal_mode, ) = connection.execute('PRAGMA journal_mode=%s' % (self.journal_mode, )).fetchone()
+            if journal_mode.lower() != self.journal_mode:
+                connection.close()
+                raise sqlite3.OperationalError(
+                    'Could not use the %r journal for %s (got %r); use journal_mode=%r on shared filesystems' % (
+                        self.journal_mode, self.filename, journal_mode, 'delete'))
+            connection.executescript(self.SCHEMA)
+            self._connection = connection
+        return self._connection
+
+    @contextlib.contextmanager
+    def transaction(self):
+        connection = self.connection
+        # Take the write lock up front, so concurrent writers queue instead of deadlocking.
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield connection
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        else:
+            connection.execute('COMMIT')
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
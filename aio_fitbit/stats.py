@@ -0,0 +1,58 @@
+from collections import defaultdict, deque, namedtuple
+
+
+EndpointTransfer = namedtuple('EndpointTransfer', ('requests', 'wire_bytes', 'decoded_bytes'))
+EndpointTransfer.EMPTY = EndpointTransfer(0, 0, 0)
+
+
+class TransferStats():
+    """Counts the bytes each endpoint moved, before and after decompression."""
+
+    def __init__(self):
+        self._endpoints = defaultdict(lambda: EndpointTransfer.EMPTY)
+
+    def record(self, endpoint, wire_bytes, decoded_bytes):
+        current = self._endpoints[endpoint]
+        self._endpoints[endpoint] = EndpointTransfer(
+            requests=current.requests + 1,
+            wire_bytes=current.wire_bytes + wire_bytes,
+            decoded_bytes=current.decoded_bytes + decoded_bytes,
+        )
+
+    def snapshot(self):
+        return dict(self._endpoints)
+
+    def totals(self):
+        return EndpointTransfer._make(map(sum, zip(EndpointTransfer.EMPTY, *self._endpoints.values())))
+
+    def compression_ratio(self, endpoint=None):
+        if endpoint is None:
+            transfer = self.totals()
+        else:
+            transfer = self._endpoints.get(endpoint, EndpointTransfer.EMPTY)
+        if not transfer.wire_bytes:
+            return None
+        return transfer.decoded_bytes / transfer.wire_bytes
+
+    def reset(self):
+        self._endpoints.clear()
+
+
+class LatencyTracker():
+    """Keeps the most recent times to response headers for each endpoint."""
+
+    def __init__(self, window=200, min_samples=20):
+        self.min_samples = min_samples
+        self._latencies = defaultdict(lambda: deque(maxlen=window))
+
+    def record(self, endpoint, seconds):
+        self._latencies[endpoint].append(seconds)
+
+    def percentile(self, endpoint, percent):
+        """Return the given percentile, or None until there are `min_samples` samples."""
+        latencies = self._latencies.get(endpoint)
+        if not latencies or len(latencies) < self.min_samples:
+            return None
+        ordered = sorted(latencies)
+        index = min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))
+        return ordered[index]
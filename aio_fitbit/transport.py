@@ -0,0 +1,447 @@
+import asyncio
+import base64
+from collections import defaultdict, deque, namedtuple
+import gzip
+import json
+import time
+import zlib
+
+from aiohttp import ClientSession, request as aiorequest
+from multidict import CIMultiDict, CIMultiDictProxy
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+ACCEPT_ENCODING = 'gzip, deflate, br' if brotli is not None else 'gzip, deflate'
+
+
+# Headers and JSON body fields that must never be written to a cassette.
+PRIVATE_HEADERS = frozenset(('authorization', 'cookie'))
+PRIVATE_RESPONSE_HEADERS = frozenset(('set-cookie', 'set-cookie2'))
+PRIVATE_FIELDS = frozenset(('access_token', 'refresh_token', 'id_token'))
+REDACTED = 'REDACTED'
+
+# `raw` is whether `body` is still encoded as its `Content-Encoding` header
+# says, or was already decompressed by the transport that recorded it.
+Interaction = namedtuple('Interaction', (
+    'method', 'url', 'params', 'request_headers', 'status', 'headers', 'body', 'elapsed', 'raw'
+))
+
+
+class CassetteMissError(KeyError):
+    pass
+
+
+def interaction_key(method, url, params=None):
+    if params is None:
+        params = ()
+    elif isinstance(params, dict):
+        params = params.items()
+    return (method.upper(), str(url), tuple(sorted((str(k), str(v)) for k, v in params)))
+
+
+def is_encoded(headers, body):
+    """Whether `body` can be decoded with the `Content-Encoding` in `headers`."""
+    encoding = CIMultiDict(headers).get('Content-Encoding', 'identity')
+    try:
+        decoder = StreamDecoder(encoding)
+        decoder.decompress(body)
+        decoder.flush()
+    except Exception:
+        return False
+    return decoder.encoding != 'identity'
+
+
+def _redact_fields(data):
+    if isinstance(data, dict):
+        return {
+            key: REDACTED if key in PRIVATE_FIELDS else _redact_fields(value)
+            for key, value in data.items()
+        }
+    if isinstance(data, list):
+        return [_redact_fields(value) for value in data]
+    return data
+
+
+def redact_body(headers, body, raw):
+    """Replace any tokens in a JSON body; return the (body, raw) to record.
+
+    A redacted body is stored decoded, whatever its `Content-Encoding`.
+    """
+    decoded = body
+    try:
+        if raw:
+            decoder = StreamDecoder(CIMultiDict(headers).get('Content-Encoding', 'identity'))
+            decoded = decoder.decompress(body) + decoder.flush()
+        data = json.loads(decoded.decode('utf-8'))
+    except Exception:
+        # Not JSON, so there are no token fields to find.
+        return body, raw
+    redacted = _redact_fields(data)
+    if redacted == data:
+        return body, raw
+    return json.dumps(redacted).encode('utf-8'), False
+
+
+class AiohttpTransport():
+    """Sends requests with aiohttp.
+
+    With `compress`, responses are requested compressed and returned as
+    they came off the wire; the client decodes them with `DecodedResponse`.
+    """
+
+    def __init__(self, compress=True):
+        self.compress = compress
+        self._session = None
+
+    @property
+    def accept_encoding(self):
+        return ACCEPT_ENCODING if self.compress else None
+
+    def request(self, method, url, loop=None, **aio_kwargs):
+        if not self.compress:
+            return aiorequest(method, url, loop=loop, **aio_kwargs)
+        if self._session is None or self._session.closed:
+            self._session = ClientSession(loop=loop, auto_decompress=False)
+        return self._session.request(method, url, **aio_kwargs)
+
+    @asyncio.coroutine
+    def close(self):
+        if self._session is not None:
+            session, self._session = self._session, None
+            yield from session.close()
+
+
+class Cassette():
+    """Recorded interactions, stored as gzipped JSON lines.
+
+    Every appended interaction is written as its own gzip member, so a
+    recording that is interrupted still leaves a readable cassette.
+    """
+
+    def __init__(self, filename):
+        self.filename = str(filename)
+        self.interactions = []
+
+    def load(self):
+        self.interactions = []
+        with gzip.open(self.filename, 'rt', encoding='utf-8') as file:
+            for line in file:
+                if line.strip():
+                    self.interactions.append(self._decode(json.loads(line)))
+        return self
+
+    def append(self, interaction):
+        self.interactions.append(interaction)
+        with gzip.open(self.filename, 'at', encoding='utf-8') as file:
+            file.write(json.dumps(self._encode(interaction), separators=(',', ':')))
+            file.write('\n')
+
+    @staticmethod
+    def _encode(interaction):
+        data = interaction._asdict()
+        body = data.pop('body')
+        try:
+            data['body'] = body.decode('utf-8')
+        except UnicodeDecodeError:
+            data['body_b64'] = base64.b64encode(body).decode('ascii')
+        return data
+
+    @staticmethod
+    def _decode(data):
+        if 'body_b64' in data:
+            data['body'] = base64.b64decode(data.pop('body_b64'))
+        else:
+            data['body'] = data['body'].encode('utf-8')
+        data['params'] = tuple(tuple(pair) for pair in data['params'])
+        data['request_headers'] = [tuple(pair) for pair in data['request_headers']]
+        data['headers'] = [tuple(pair) for pair in data['headers']]
+        if 'raw' not in data:
+            # Recorded before `raw` was stored; see if the body still needs decoding.
+            data['raw'] = is_encoded(data['headers'], data['body'])
+        return Interaction(**data)
+
+
+class RecordingTransport():
+    """Sends requests with another transport, appending each interaction to a cassette.
+
+    Credentials are left out: `PRIVATE_HEADERS` of requests,
+    `PRIVATE_RESPONSE_HEADERS` of responses and any `PRIVATE_FIELDS` in
+    JSON bodies, such as the tokens returned by a refresh.
+    """
+
+    def __init__(self, cassette, transport=None):
+        self.cassette = cassette
+        self.transport = transport or AiohttpTransport()
+
+    @property
+    def accept_encoding(self):
+        return self.transport.accept_encoding
+
+    @asyncio.coroutine
+    def close(self):
+        yield from self.transport.close()
+
+    @asyncio.coroutine
+    def request(self, method, url, params=None, headers=None, **aio_kwargs):
+        start = time.monotonic()
+        response = yield from self.transport.request(method, url, params=params, headers=headers, **aio_kwargs)
+        elapsed = time.monotonic() - start
+        body = yield from response.read()
+        response.release()
+        _, _, params_key = interaction_key(method, url, params)
+        response_headers = [
+            (name, value) for name, value in response.headers.items()
+            if name.lower() not in PRIVATE_RESPONSE_HEADERS
+        ]
+        body, raw = redact_body(response_headers, body, bool(self.accept_encoding))
+        interaction = Interaction(
+            method=method.upper(),
+            url=str(url),
+            params=params_key,
+            request_headers=[
+                (name, value) for name, value in (headers or {}).items()
+                if name.lower() not in PRIVATE_HEADERS
+            ],
+            status=response.status,
+            headers=response_headers,
+            body=body,
+            elapsed=elapsed,
+            raw=raw,
+        )
+        self.cassette.append(interaction)
+        # The body has been consumed, so hand back what a replay would.
+        return ReplayResponse(interaction)
+
+
+class ReplayTransport():
+    """Serves responses from a cassette instead of the network.
+
+    `latency_scale` multiplies the recorded time to headers; 0 replays at
+    full speed and 1 with the original timing. With `repeat`, interactions
+    are served round robin instead of each being used once.
+    """
+
+    # Raw bodies are replayed exactly as they were recorded, and decoded
+    # bodies without their `Content-Encoding`; see `ReplayResponse`.
+    accept_encoding = ACCEPT_ENCODING
+    # Responses aren't live, so clients must not save the tokens or API
+    # usage they contain.
+    replaying = True
+
+    def __init__(self, cassette, latency_scale=0.0, repeat=False):
+        self.latency_scale = latency_scale
+        self.repeat = repeat
+        self._interactions = defaultdict(deque)
+        for interaction in cassette.interactions:
+            key = (interaction.method, interaction.url, interaction.params)
+            self._interactions[key].append(interaction)
+
+    @asyncio.coroutine
+    def close(self):
+        pass
+
+    @asyncio.coroutine
+    def request(self, method, url, params=None, **aio_kwargs):
+        key = interaction_key(method, url, params)
+        queue = self._interactions.get(key)
+        if not queue:
+            raise CassetteMissError(key)
+        interaction = queue.popleft()
+        if self.repeat:
+            queue.append(interaction)
+        delay = interaction.elapsed * self.latency_scale
+        if delay > 0:
+            yield from asyncio.sleep(delay)
+        return ReplayResponse(interaction)
+
+
+class ReplayStreamReader():
+
+    def __init__(self, body):
+        self._body = body
+        self._offset = 0
+
+    def at_eof(self):
+        return self._offset >= len(self._body)
+
+    @asyncio.coroutine
+    def read(self, n=-1):
+        if n < 0:
+            n = len(self._body) - self._offset
+        chunk = self._body[self._offset:self._offset + n]
+        self._offset += len(chunk)
+        return chunk
+
+    @asyncio.coroutine
+    def readany(self):
+        return (yield from self.read(2 ** 16))
+
+
+class ReplayResponse():
+
+    def __init__(self, interaction):
+        self.method = interaction.method
+        self.url = interaction.url
+        self.status = interaction.status
+        headers = interaction.headers
+        if not interaction.raw:
+            # The body was stored decoded; don't let it be decoded again.
+            headers = [
+                (name, value) for name, value in headers
+                if name.lower() not in ('content-encoding', 'content-length')
+            ]
+        self.headers = CIMultiDictProxy(CIMultiDict(headers))
+        self.content = ReplayStreamReader(interaction.body)
+        self._body = interaction.body
+
+    @asyncio.coroutine
+    def read(self):
+        return self._body
+
+    @asyncio.coroutine
+    def text(self, encoding='utf-8'):
+        return self._body.decode(encoding)
+
+    @asyncio.coroutine
+    def json(self, loads=json.loads):
+        return loads(self._body.decode('utf-8'))
+
+    def close(self):
+        pass
+
+    def release(self):
+        pass
+
+    def __repr__(self):
+        return '<{} {} {} [{}]>'.format(self.__class__.__name__, self.method, self.url, self.status)
+
+
+class StreamDecoder():
+
+    def __init__(self, encoding):
+        self.encoding = (encoding or 'identity').strip().lower()
+        self._started = False
+        if self.encoding in ('gzip', 'x-gzip'):
+            self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif self.encoding == 'deflate':
+            self._decompressor = zlib.decompressobj()
+        elif self.encoding == 'br':
+            if brotli is None:
+                raise ValueError('Received a brotli encoded response, but brotli is not installed')
+            self._decompressor = brotli.Decompressor()
+        elif self.encoding == 'identity':
+            self._decompressor = None
+        else:
+            raise ValueError('Unsupported content encoding %r' % (encoding, ))
+
+    def decompress(self, chunk):
+        if self._decompressor is None:
+            return chunk
+        if self.encoding == 'br':
+            return self._decompressor.process(chunk)
+        started, self._started = self._started, True
+        try:
+            return self._decompressor.decompress(chunk)
+        except zlib.error:
+            if self.encoding != 'deflate' or started:
+                raise
+            # Some servers send raw deflate data without the zlib header.
+            self._decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+            return self._decompressor.decompress(chunk)
+
+    def flush(self):
+        if self._decompressor is None or self.encoding == 'br':
+            return b''
+        return self._decompressor.flush()
+
+
+class DecodingStreamReader():
+    """Decompresses a response stream as it is read, counting bytes in and out."""
+
+    CHUNK_SIZE = 2 ** 16
+
+    def __init__(self, stream, encoding, on_eof=None):
+        self._stream = stream
+        self._decoder = StreamDecoder(encoding)
+        self._buffer = bytearray()
+        self._eof = False
+        self._on_eof = on_eof
+        self.wire_bytes = 0
+        self.decoded_bytes = 0
+
+    def at_eof(self):
+        return self._eof and not self._buffer
+
+    @asyncio.coroutine
+    def _fill(self):
+        chunk = yield from self._stream.read(self.CHUNK_SIZE)
+        if chunk:
+            self.wire_bytes += len(chunk)
+            decoded = self._decoder.decompress(chunk)
+        else:
+            decoded = self._decoder.flush()
+            self._eof = True
+        self.decoded_bytes += len(decoded)
+        self._buffer.extend(decoded)
+        if self._eof and self._on_eof is not None:
+            on_eof, self._on_eof = self._on_eof, None
+            on_eof(self.wire_bytes, self.decoded_bytes)
+
+    @asyncio.coroutine
+    def read(self, n=-1):
+        if n < 0:
+            while not self._eof:
+                yield from self._fill()
+            n = len(self._buffer)
+        else:
+            while not self._eof and not self._buffer:
+                yield from self._fill()
+        data = bytes(self._buffer[:n])
+        del self._buffer[:n]
+        return data
+
+    @asyncio.coroutine
+    def readany(self):
+        return (yield from self.read(max(len(self._buffer), 1)))
+
+
+class DecodedResponse():
+    """Wraps a response whose body may still be compressed.
+
+    The body is decoded according to `Content-Encoding` as it is read.
+    `on_complete(wire_bytes, decoded_bytes)` is called once it has all been read.
+    """
+
+    def __init__(self, response, encoding=None, on_complete=None):
+        self._response = response
+        if encoding is None:
+            encoding = response.headers.get('Content-Encoding', 'identity')
+        self.content = DecodingStreamReader(response.content, encoding, on_eof=on_complete)
+        self._body = None
+
+    def __getattr__(self, name):
+        return getattr(self._response, name)
+
+    @asyncio.coroutine
+    def read(self):
+        if self._body is None:
+            self._body = yield from self.content.read()
+            self._response.release()
+        return self._body
+
+    @asyncio.coroutine
+    def text(self, encoding='utf-8'):
+        body = yield from self.read()
+        return body.decode(encoding)
+
+    @asyncio.coroutine
+    def json(self, loads=json.loads):
+        body = yield from self.read()
+        return loads(body.decode('utf-8'))
+
+    def __repr__(self):
+        return '<{} {!r}>'.format(self.__class__.__name__, self._response)
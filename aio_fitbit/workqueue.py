@@ -0,0 +1,119 @@
+from collections import namedtuple
+import datetime
+
+from aio_fitbit.sqlite import SqliteDatabase, from_timestamp, to_timestamp
+
+
+Task = namedtuple('Task', ('id', 'user_id', 'date', 'endpoint', 'attempts'))
+
+
+class WorkStore(SqliteDatabase):
+    """(user, date, endpoint) sync tasks, claimed by workers with expiring leases.
+
+    A worker that dies keeps its tasks only until their leases run out;
+    after that any other worker can claim them again.
+    """
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS task (
+            id INTEGER PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            date TEXT NOT NULL,
+            endpoint TEXT NOT NULL,
+            state TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            not_before REAL NOT NULL DEFAULT 0,
+            lease_owner TEXT,
+            lease_until REAL,
+            last_error TEXT,
+            UNIQUE (user_id, date, endpoint)
+        );
+        CREATE INDEX IF NOT EXISTS task_claimable ON task (state, not_before);
+    '''
+
+    DATE_FORMAT = '%Y-%m-%d'
+
+    def enqueue(self, tasks):
+        """Add (user_id, date, endpoint) tasks, skipping any already queued."""
+        rows = [(user_id, date.strftime(self.DATE_FORMAT), endpoint) for user_id, date, endpoint in tasks]
+        with self.transaction() as connection:
+            before = connection.total_changes
+            connection.executemany(
+                'INSERT OR IGNORE INTO task (user_id, date, endpoint) VALUES (?, ?, ?)', rows)
+            return connection.total_changes - before
+
+    def enqueue_range(self, user_id, start_date, end_date, endpoint):
+        day_count = (end_date - start_date).days + 1
+        return self.enqueue(
+            (user_id, start_date + datetime.timedelta(days=n), endpoint)
+            for n in range(day_count)
+        )
+
+    def claim(self, owner, limit=1, lease_seconds=300):
+        now = datetime.datetime.now()
+        lease_until = now + datetime.timedelta(seconds=lease_seconds)
+        with self.transaction() as connection:
+            rows = connection.execute(
+                "SELECT id, user_id, date, endpoint, attempts FROM task "
+                "WHERE state = 'pending' AND not_before <= ? "
+                "  AND (lease_until IS NULL OR lease_until < ?) "
+                "ORDER BY not_before, id LIMIT ?",
+                (to_timestamp(now), to_timestamp(now), limit)
+            ).fetchall()
+            connection.executemany(
+                'UPDATE task SET lease_owner = ?, lease_until = ?, attempts = attempts + 1 WHERE id = ?',
+                [(owner, to_timestamp(lease_until), row[0]) for row in rows]
+            )
+        return [
+            Task(task_id, user_id, datetime.datetime.strptime(date, self.DATE_FORMAT).date(), endpoint, attempts + 1)
+            for task_id, user_id, date, endpoint, attempts in rows
+        ]
+
+    def renew(self, owner, task_ids, lease_seconds=300):
+        lease_until = datetime.datetime.now() + datetime.timedelta(seconds=lease_seconds)
+        with self.transaction() as connection:
+            connection.executemany(
+                'UPDATE task SET lease_until = ? WHERE id = ? AND lease_owner = ?',
+                [(to_timestamp(lease_until), task_id, owner) for task_id in task_ids]
+            )
+
+    def complete(self, owner, task_id):
+        with self.transaction() as connection:
+            cursor = connection.execute(
+                "UPDATE task SET state = 'done', lease_owner = NULL, lease_until = NULL, last_error = NULL "
+                "WHERE id = ? AND lease_owner = ?",
+                (task_id, owner)
+            )
+            return cursor.rowcount == 1
+
+    def retry(self, owner, task_id, delay_seconds, error=None, max_attempts=5, count_attempt=True):
+        """Release a task to be tried again later, or fail it after `max_attempts`.
+
+        Without `count_attempt` (e.g. when rate limited) the claim isn't
+        counted towards `max_attempts`.
+        """
+        not_before = datetime.datetime.now() + datetime.timedelta(seconds=delay_seconds)
+        uncounted = 0 if count_attempt else 1
+        with self.transaction() as connection:
+            connection.execute(
+                "UPDATE task SET "
+                "  attempts = attempts - ?, "
+                "  state = CASE WHEN attempts - ? >= ? THEN 'failed' ELSE 'pending' END, "
+                "  not_before = ?, lease_owner = NULL, lease_until = NULL, last_error = ? "
+                "WHERE id = ? AND lease_owner = ?",
+                (uncounted, uncounted, max_attempts, to_timestamp(not_before), error, task_id, owner)
+            )
+
+    def next_claimable(self):
+        """When the next pending task can be claimed, or None if none are pending.
+
+        A pending task may be waiting for its `not_before`, or for the lease
+        of a worker that died to run out.
+        """
+        (timestamp, ) = self.connection.execute(
+            "SELECT MIN(MAX(not_before, COALESCE(lease_until, 0))) FROM task WHERE state = 'pending'"
+        ).fetchone()
+        return None if timestamp is None else from_timestamp(timestamp)
+
+    def counts(self):
+        return dict(self.connection.execute('SELECT state, COUNT(*) FROM task GROUP BY state'))
@@ -0,0 +1,235 @@
+"""Per-day statistics computed while samples are ingested.
+
+Each aggregator sees a day's samples as (datetime64[s], uint8) arrays,
+possibly over several `update` calls, and keeps only a small running
+state. `IngestionPipeline` runs them as an ingestion hook and stores the
+results next to the day's partition, so analytics can read one small
+record per day instead of the raw series.
+"""
+import datetime
+import json
+import pathlib
+
+import numpy as np
+import pandas as pd
+
+from .arrow_store import ARROW_DATA_STORE_DIR, day_path
+
+
+class Aggregator():
+
+    name = None
+
+    def update(self, times, bpm):
+        raise NotImplementedError()
+
+    def result(self):
+        raise NotImplementedError()
+
+
+class Summary(Aggregator):
+    """Count, mean, variance, min and max, merged a batch at a time (Welford/Chan)."""
+
+    name = 'summary'
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+
+    def update(self, times, bpm):
+        if not len(bpm):
+            return
+        values = bpm.astype(np.float64)
+        count = len(values)
+        mean = values.mean()
+        m2 = ((values - mean) ** 2).sum()
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += float(delta * count / total)
+        self.m2 += float(m2 + delta ** 2 * self.count * count / total)
+        self.count = total
+        low, high = int(values.min()), int(values.max())
+        self.min = low if self.min is None else min(self.min, low)
+        self.max = high if self.max is None else max(self.max, high)
+
+    def result(self):
+        variance = self.m2 / (self.count - 1) if self.count > 1 else None
+        return dict(
+            count=self.count,
+            mean=self.mean if self.count else None,
+            variance=variance,
+            min=self.min,
+            max=self.max,
+        )
+
+
+class TimeInBand(Aggregator):
+    """Seconds spent in each bpm band, counting each sample until the next one."""
+
+    name = 'time_in_band'
+
+    def __init__(self, bands=((0, 60), (60, 100), (100, 140), (140, 256)), max_gap=15):
+        self.bands = bands
+        self.edges = np.array([low for low, _ in bands] + [bands[-1][1]])
+        self.max_gap = max_gap
+        self.seconds = np.zeros(len(bands), dtype=np.int64)
+        self._last = None
+        self._typical_gap = None
+
+    def update(self, times, bpm):
+        if not len(bpm):
+            return
+        seconds = times.astype(np.int64)
+        values = bpm.astype(np.int64)
+        if self._last is not None:
+            # Close off the last sample of the previous batch.
+            seconds = np.r_[self._last[0], seconds]
+            values = np.r_[self._last[1], values]
+        gaps = np.diff(seconds)
+        durations = np.minimum(gaps, self.max_gap)
+        bands = np.digitize(values[:-1], self.edges) - 1
+        valid = (bands >= 0) & (bands < len(self.bands))
+        self.seconds += np.bincount(bands[valid], weights=durations[valid], minlength=len(self.bands)).astype(np.int64)
+        if len(gaps):
+            self._typical_gap = int(np.median(gaps))
+        self._last = (seconds[-1], values[-1])
+
+    def result(self):
+        seconds = self.seconds.copy()
+        if self._last is not None:
+            # The final sample has no next one; it lasts the typical gap, as in `zones._sample_seconds`.
+            gap = self._typical_gap if self._typical_gap is not None else 60
+            band = np.digitize(self._last[1], self.edges) - 1
+            if 0 <= band < len(self.bands):
+                seconds[band] += min(gap, self.max_gap)
+        return {'%d-%d' % band: int(band_seconds) for band, band_seconds in zip(self.bands, seconds)}
+
+
+class TumblingMean(Aggregator):
+    """Mean bpm over consecutive, non-overlapping `window` second windows of the day.
+
+    These are tumbling windows, not a rolling average: each sample counts
+    towards exactly one window, so a day stores 86400 / `window` means.
+    """
+
+    name = 'tumbling_mean'
+
+    def __init__(self, window=300):
+        self.window = window
+        self.sums = np.zeros(86400 // window)
+        self.counts = np.zeros(86400 // window, dtype=np.int64)
+
+    def update(self, times, bpm):
+        if not len(bpm):
+            return
+        seconds = (times - times.astype('datetime64[D]')).astype(np.int64)
+        windows = seconds // self.window
+        self.sums += np.bincount(windows, weights=bpm, minlength=len(self.sums))
+        self.counts += np.bincount(windows, minlength=len(self.counts))
+
+    def result(self):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = self.sums / self.counts
+        return dict(
+            window=self.window,
+            means=[None if np.isnan(mean) else round(mean, 2) for mean in means.tolist()],
+        )
+
+
+class Quantiles(Aggregator):
+    """Exact quantiles from a 256 bin histogram; bpm is stored as uint8."""
+
+    name = 'quantiles'
+
+    def __init__(self, quantiles=(0.05, 0.25, 0.5, 0.75, 0.95)):
+        self.quantiles = quantiles
+        self.histogram = np.zeros(256, dtype=np.int64)
+
+    def update(self, times, bpm):
+        self.histogram += np.bincount(bpm.astype(np.uint8), minlength=256)
+
+    def result(self):
+        total = self.histogram.sum()
+        if not total:
+            return {str(q): None for q in self.quantiles}
+        cumulative = np.cumsum(self.histogram)
+        positions = np.searchsorted(cumulative, np.array(self.quantiles) * total, side='left')
+        return {str(q): int(position) for q, position in zip(self.quantiles, positions)}
+
+
+class Outliers(Aggregator):
+    """Counts samples outside a plausible range, and implausible jumps between samples."""
+
+    name = 'outliers'
+
+    def __init__(self, low=30, high=220, max_jump_per_second=30):
+        self.low = low
+        self.high = high
+        self.max_jump_per_second = max_jump_per_second
+        self.out_of_range = 0
+        self.jumps = 0
+        self._last = None
+
+    def update(self, times, bpm):
+        if not len(bpm):
+            return
+        seconds = times.astype(np.int64)
+        values = bpm.astype(np.int64)
+        self.out_of_range += int(np.count_nonzero((values < self.low) | (values > self.high)))
+        if self._last is not None:
+            seconds = np.r_[self._last[0], seconds]
+            values = np.r_[self._last[1], values]
+        gaps = np.maximum(np.diff(seconds), 1)
+        self.jumps += int(np.count_nonzero(np.abs(np.diff(values)) > self.max_jump_per_second * gaps))
+        self._last = (seconds[-1], values[-1])
+
+    def result(self):
+        return dict(out_of_range=self.out_of_range, jumps=self.jumps)
+
+
+DEFAULT_AGGREGATORS = (Summary, TimeInBand, TumblingMean, Quantiles, Outliers)
+
+
+def stats_path(directory, date):
+    return day_path(directory, date).parent / 'stats.json'
+
+
+class IngestionPipeline():
+    """An ingestion hook that runs a fresh set of aggregators over each day."""
+
+    def __init__(self, aggregators=DEFAULT_AGGREGATORS):
+        self.aggregators = aggregators
+
+    def aggregate(self, times, bpm):
+        results = {}
+        for aggregator_class in self.aggregators:
+            aggregator = aggregator_class()
+            aggregator.update(times, bpm)
+            results[aggregator.name] = aggregator.result()
+        return results
+
+    def __call__(self, directory, date, times, bpm):
+        results = self.aggregate(np.asarray(times, dtype='datetime64[s]'), np.asarray(bpm))
+        path = stats_path(directory, date)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + '.tmp')
+        with open(str(tmp_path), 'w') as file:
+            json.dump(results, file)
+        tmp_path.replace(path)
+        return results
+
+
+def load_daily_stats(directory=ARROW_DATA_STORE_DIR, start=None, end=None):
+    """Load the stored per-day results into a frame, one row per day."""
+    rows = {}
+    # Found by their own files, so days stored in any format are included.
+    for path in sorted(pathlib.Path(directory).glob('date=*/stats.json')):
+        date = datetime.datetime.strptime(path.parent.name[len('date='):], '%Y-%m-%d').date()
+        if (start is not None and date < start) or (end is not None and date > end):
+            continue
+        with open(str(path)) as file:
+            rows[date] = pd.json_normalize(json.load(file), max_level=1).iloc[0]
+    return pd.DataFrame.from_dict(rows, orient='index')
@@ -0,0 +1,141 @@
+import datetime
+import pathlib
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from . import codec
+
+
+ARROW_DATA_STORE_DIR = './heartrate_datastore'
+
+SCHEMA = pa.schema([
+    ('Datetime', pa.timestamp('s')),
+    ('Heartrate(BPM)', pa.uint8()),
+])
+
+FORMATS = {
+    'arrow': 'part.arrow',
+    'parquet': 'part.parquet',
+    # The compact delta/run-length encoding from `heartrate.codec`.
+    'delta': 'part.hrdc',
+}
+
+
+def to_bpm_array(values):
+    values = np.asarray(values, dtype=np.float64)
+    return np.clip(np.rint(values), 0, 255).astype(np.uint8)
+
+
+def frame_to_arrays(frame):
+    """Convert a `load_save` style frame into (datetime64[s], uint8) arrays."""
+    frame = frame.dropna()
+    times = frame.index.values.astype('datetime64[s]')
+    return times, to_bpm_array(frame.iloc[:, 0].values)
+
+
+def arrays_to_table(times, bpm):
+    return pa.Table.from_arrays([
+        pa.array(np.asarray(times, dtype='datetime64[s]'), type=pa.timestamp('s')),
+        pa.array(np.asarray(bpm, dtype=np.uint8), type=pa.uint8()),
+    ], schema=SCHEMA)
+
+
+def day_path(directory, date, format='arrow'):
+    # Hive style partitions, so `pyarrow.dataset` can read the whole store.
+    return pathlib.Path(directory) / 'date={}'.format(date.isoformat()) / FORMATS[format]
+
+
+def stored_dates(directory=ARROW_DATA_STORE_DIR, format='arrow'):
+    dates = set()
+    for path in pathlib.Path(directory).glob('date=*/' + FORMATS[format]):
+        dates.add(datetime.datetime.strptime(path.parent.name[len('date='):], '%Y-%m-%d').date())
+    return dates
+
+
+def write_day(directory, date, times, bpm, format='arrow'):
+    path = day_path(directory, date, format)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + '.tmp')
+    if format == 'delta':
+        with open(str(tmp_path), 'wb') as file:
+            file.write(codec.encode(times, bpm))
+    elif format == 'arrow':
+        with pa.OSFile(str(tmp_path), 'wb') as sink:
+            with pa.ipc.new_file(sink, SCHEMA) as writer:
+                writer.write_table(arrays_to_table(times, bpm))
+    else:
+        pq.write_table(arrays_to_table(times, bpm), str(tmp_path), compression='zstd')
+    # Readers never see a half written partition.
+    tmp_path.replace(path)
+    return path
+
+
+def unique_samples(times, bpm):
+    """Sort samples by time, keeping only the first sample given for each time."""
+    times, first = np.unique(times, return_index=True)
+    return times, bpm[first]
+
+
+def export_arrays(times, bpm, directory=ARROW_DATA_STORE_DIR, format='arrow', merge=False):
+    """Write samples into one partition per day.
+
+    Days already stored are replaced, or with `merge`, combined with the
+    new samples; the stored sample is kept where both have the same time.
+    """
+    times = np.asarray(times, dtype='datetime64[s]')
+    order = np.argsort(times, kind='stable')
+    times = times[order]
+    bpm = np.asarray(bpm)[order]
+    days = times.astype('datetime64[D]')
+    boundaries = np.flatnonzero(days[1:] != days[:-1]) + 1
+    written = []
+    for start, end in zip(np.r_[0, boundaries], np.r_[boundaries, len(times)]):
+        if start == end:
+            continue
+        date = days[start].item()
+        day_times, day_bpm = times[start:end], bpm[start:end]
+        if merge and day_path(directory, date, format).exists():
+            stored = read_day(directory, date, format)
+            # Copied out of the stored table, which may be memory mapped from the file being replaced.
+            day_times = np.r_[stored.column('Datetime').to_numpy().astype('datetime64[s]'), day_times]
+            day_bpm = np.r_[stored.column('Heartrate(BPM)').to_numpy(), day_bpm]
+        day_times, day_bpm = unique_samples(day_times, day_bpm)
+        written.append(write_day(directory, date, day_times, day_bpm, format))
+    return written
+
+
+def export_frame(frame, directory=ARROW_DATA_STORE_DIR, format='arrow'):
+    times, bpm = frame_to_arrays(frame)
+    return export_arrays(times, bpm, directory, format)
+
+
+def read_day(directory, date, format='arrow'):
+    path = str(day_path(directory, date, format))
+    if format == 'delta':
+        with open(path, 'rb') as file:
+            return arrays_to_table(*codec.decode(file.read()))
+    if format == 'arrow':
+        # The table's buffers point into the memory map; nothing is copied.
+        return pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+    return pq.read_table(path, memory_map=True)
+
+
+def read_range(directory=ARROW_DATA_STORE_DIR, start=None, end=None, format='arrow'):
+    dates = sorted(
+        date for date in stored_dates(directory, format)
+        if (start is None or date >= start) and (end is None or date <= end)
+    )
+    if not dates:
+        return SCHEMA.empty_table()
+    return pa.concat_tables([read_day(directory, date, format) for date in dates])
+
+
+def to_frame(table):
+    """Convert a table back into the frame layout used by `load_save`."""
+    return pd.DataFrame(
+        {'Heartrate(BPM)': table.column('Heartrate(BPM)').to_numpy()},
+        index=pd.DatetimeIndex(table.column('Datetime').to_numpy(), name='Datetime'),
+    )
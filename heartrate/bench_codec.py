@@ -0,0 +1,113 @@
+"""Compare the delta codec with the legacy HDF5 store and the Arrow formats.
+
+    python -m heartrate.bench_codec --days 30
+    python -m heartrate.bench_codec --hdf ./heartrate_datastore.h5
+
+Reports the size per sample and the write and read throughput of each
+format, for synthetic 1 second data or for an existing HDF5 store. The
+HDF5 rows need PyTables; they're skipped without it.
+"""
+import argparse
+import pathlib
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from .arrow_store import export_arrays, read_range, stored_dates, to_frame
+from .importers import import_legacy_hdf
+
+
+def synthetic_samples(days, seed=0):
+    """Roughly 1 second samples with occasional dropouts and a slowly wandering rate."""
+    rng = np.random.default_rng(seed)
+    count = days * 86400
+    gaps = rng.choice([1, 2, 5, 15, 600], size=count - 1, p=[0.9, 0.05, 0.03, 0.019, 0.001])
+    seconds = np.r_[0, np.cumsum(gaps)]
+    seconds = seconds[seconds < days * 86400]
+    start = np.datetime64('2017-01-01T00:00:00', 's')
+    times = start + seconds.astype('timedelta64[s]')
+    walk = np.cumsum(rng.integers(-1, 2, size=len(seconds)))
+    bpm = np.clip(70 + 20 * np.sin(seconds / 7200) + walk % 40 - 20, 40, 200).astype(np.uint8)
+    return times, bpm
+
+
+def timed(function, *args, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def directory_size(path):
+    return sum(file.stat().st_size for file in pathlib.Path(path).rglob('*') if file.is_file())
+
+
+def write_hdf(frame, filename):
+    # As `load_save.save_numpy_data` writes it.
+    frame.to_hdf(filename, key='heartrate', format='table', mode='w', complib='zlib', complevel=9)
+
+
+def bench_hdf(times, bpm, directory):
+    filename = str(pathlib.Path(directory) / 'heartrate_datastore.h5')
+    frame = pd.DataFrame(
+        {'Heartrate(BPM)': bpm.astype(np.float64)},
+        index=pd.DatetimeIndex(times, name='Datetime'),
+    )
+    write_seconds, _ = timed(write_hdf, frame, filename)
+    read_seconds, _ = timed(pd.read_hdf, filename, 'heartrate')
+    return pathlib.Path(filename).stat().st_size, write_seconds, read_seconds
+
+
+def bench_store(times, bpm, directory, format):
+    directory = pathlib.Path(directory) / format
+    write_seconds, _ = timed(export_arrays, times, bpm, directory, format)
+
+    def read_all():
+        return to_frame(read_range(directory, format=format))
+
+    read_seconds, frame = timed(read_all)
+    if len(frame) != len(times) or not (frame['Heartrate(BPM)'].values == bpm).all():
+        raise AssertionError('%s did not round trip' % (format, ))
+    assert len(stored_dates(directory, format)) == len(np.unique(times.astype('datetime64[D]')))
+    return directory_size(directory), write_seconds, read_seconds
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--hdf', help='Benchmark the samples in this legacy HDF5 store instead')
+    parser.add_argument('--formats', nargs='+', default=['hdf', 'delta', 'arrow', 'parquet'])
+    args = parser.parse_args(argv)
+
+    if args.hdf:
+        times, bpm = import_legacy_hdf(args.hdf)
+    else:
+        times, bpm = synthetic_samples(args.days)
+    order = np.argsort(times, kind='stable')
+    times, bpm = times[order], bpm[order]
+    print('%d samples over %d days' % (len(times), len(np.unique(times.astype('datetime64[D]')))))
+    print('%-8s %12s %14s %12s %12s' % ('format', 'bytes', 'bytes/sample', 'write MB/s', 'read MB/s'))
+
+    # Throughput is measured against the 9 bytes of (timestamp, bpm) per sample.
+    raw_megabytes = len(times) * 9 / 1e6
+    with tempfile.TemporaryDirectory() as directory:
+        for format in args.formats:
+            try:
+                if format == 'hdf':
+                    size, write_seconds, read_seconds = bench_hdf(times, bpm, directory)
+                else:
+                    size, write_seconds, read_seconds = bench_store(times, bpm, directory, format)
+            except ImportError as e:
+                print('%-8s skipped: %s' % (format, e))
+                continue
+            print('%-8s %12d %14.3f %12.1f %12.1f' % (
+                format, size, size / len(times), raw_megabytes / write_seconds, raw_megabytes / read_seconds))
+
+
+if __name__ == '__main__':
+    main()
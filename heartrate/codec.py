@@ -0,0 +1,168 @@
+"""A compact encoding for one day of (datetime64[s], uint8) heart rate samples.
+
+Samples are close to evenly spaced and the heart rate changes slowly, so:
+
+- timestamps are stored as the first timestamp plus the run-length encoded
+  gaps between samples, as (gap, run length) varint pairs;
+- bpm is stored as the first value plus zigzag encoded deltas, bit-packed
+  in blocks of `BLOCK_SIZE` samples using the fewest bits that hold the
+  block's largest delta. A block where the rate doesn't change takes no
+  space beyond its width byte.
+
+Layout: header, one width byte per block, the packed blocks, then the
+gap varints. Encoding and decoding are vectorised with numpy; the only
+Python loops are over the distinct block widths and varint lengths.
+"""
+import struct
+
+import numpy as np
+
+
+MAGIC = b'HRDC'
+VERSION = 1
+# magic, version, first bpm, first timestamp, sample count, gap run count.
+HEADER = struct.Struct('<4sBBqII')
+BLOCK_SIZE = 128
+
+
+class CodecError(ValueError):
+    pass
+
+
+def encode_varints(values):
+    """Encode unsigned integers as LEB128 varints."""
+    values = np.asarray(values, dtype=np.uint64)
+    if not len(values):
+        return b''
+    byte_counts = np.ones(len(values), dtype=np.int64)
+    for position in range(1, 10):
+        byte_counts += (values >> np.uint64(7 * position)) > 0
+    max_bytes = int(byte_counts.max())
+    positions = np.arange(max_bytes)
+    shifts = (7 * positions).astype(np.uint64)
+    groups = ((values[:, None] >> shifts) & np.uint64(0x7f)).astype(np.uint8)
+    groups[positions < byte_counts[:, None] - 1] |= 0x80
+    return groups[positions < byte_counts[:, None]].tobytes()
+
+
+def decode_varints(data, count):
+    """Decode the first `count` LEB128 varints; return (values, bytes used)."""
+    data = np.frombuffer(data, dtype=np.uint8)
+    if not count:
+        return np.zeros(0, dtype=np.uint64), 0
+    ends = np.flatnonzero(data < 0x80)
+    if len(ends) < count:
+        raise CodecError('Truncated varints: expected %d, found %d' % (count, len(ends)))
+    ends = ends[:count]
+    used = int(ends[-1]) + 1
+    data = data[:used]
+    starts = np.r_[0, ends[:-1] + 1]
+    positions = np.arange(used) - np.repeat(starts, ends - starts + 1)
+    if positions.max() * 7 >= 64:
+        raise CodecError('Varint too long')
+    groups = (data & 0x7f).astype(np.uint64) << (7 * positions).astype(np.uint64)
+    return np.bitwise_or.reduceat(groups, starts), used
+
+
+def zigzag(deltas):
+    deltas = deltas.astype(np.int16)
+    return ((deltas << 1) ^ (deltas >> 15)).astype(np.uint16)
+
+
+def unzigzag(values):
+    values = values.astype(np.int16)
+    return (values >> 1) ^ -(values & 1)
+
+
+def _bit_widths(values):
+    """The number of bits needed for each value; values are at most 16 bits."""
+    widths = np.zeros(len(values), dtype=np.uint8)
+    for bit in range(16):
+        widths[(values >> bit) > 0] = bit + 1
+    return widths
+
+
+def pack_blocks(values):
+    """Bit-pack uint16 values in blocks; return (widths, packed bytes)."""
+    block_count = -(-len(values) // BLOCK_SIZE)
+    blocks = np.zeros(block_count * BLOCK_SIZE, dtype=np.uint16)
+    blocks[:len(values)] = values
+    blocks = blocks.reshape(block_count, BLOCK_SIZE)
+    widths = _bit_widths(blocks.max(axis=1))
+    sizes = widths.astype(np.int64) * (BLOCK_SIZE // 8)
+    offsets = np.r_[0, np.cumsum(sizes)[:-1]]
+    packed = np.zeros(int(sizes.sum()), dtype=np.uint8)
+    for width in np.unique(widths[widths > 0]).tolist():
+        selected = np.flatnonzero(widths == width)
+        bits = (blocks[selected, :, None] >> np.arange(width, dtype=np.uint16)) & 1
+        block_bytes = np.packbits(bits.astype(np.uint8).reshape(len(selected), -1), axis=1, bitorder='little')
+        packed[offsets[selected, None] + np.arange(block_bytes.shape[1])] = block_bytes
+    return widths, packed
+
+
+def unpack_blocks(widths, packed, count):
+    widths = np.asarray(widths, dtype=np.uint8)
+    sizes = widths.astype(np.int64) * (BLOCK_SIZE // 8)
+    offsets = np.r_[0, np.cumsum(sizes)[:-1]]
+    if sizes.sum() > len(packed):
+        raise CodecError('Truncated bit-packed blocks')
+    blocks = np.zeros((len(widths), BLOCK_SIZE), dtype=np.uint16)
+    for width in np.unique(widths[widths > 0]).tolist():
+        selected = np.flatnonzero(widths == width)
+        block_bytes = packed[offsets[selected, None] + np.arange(width * BLOCK_SIZE // 8)]
+        bits = np.unpackbits(block_bytes, axis=1, bitorder='little').reshape(len(selected), BLOCK_SIZE, width)
+        weights = (1 << np.arange(width)).astype(np.uint16)
+        blocks[selected] = (bits.astype(np.uint16) * weights).sum(axis=2, dtype=np.uint16)
+    return blocks.reshape(-1)[:count]
+
+
+def encode(times, bpm):
+    """Encode time-sorted samples into bytes."""
+    seconds = np.asarray(times, dtype='datetime64[s]').astype(np.int64)
+    bpm = np.asarray(bpm, dtype=np.uint8)
+    if len(seconds) != len(bpm):
+        raise ValueError('times and bpm differ in length')
+    if not len(seconds):
+        return HEADER.pack(MAGIC, VERSION, 0, 0, 0, 0)
+    gaps = np.diff(seconds)
+    if (gaps < 0).any():
+        raise ValueError('times must be sorted')
+
+    run_starts = np.r_[0, np.flatnonzero(gaps[1:] != gaps[:-1]) + 1] if len(gaps) else np.zeros(0, dtype=np.int64)
+    run_lengths = np.diff(np.r_[run_starts, len(gaps)])
+    runs = np.empty(2 * len(run_starts), dtype=np.uint64)
+    runs[0::2] = gaps[run_starts]
+    runs[1::2] = run_lengths
+
+    deltas = zigzag(np.diff(bpm.astype(np.int16), prepend=bpm[:1].astype(np.int16)))
+    widths, packed = pack_blocks(deltas)
+    header = HEADER.pack(MAGIC, VERSION, int(bpm[0]), int(seconds[0]), len(bpm), len(run_starts))
+    return b''.join((header, widths.tobytes(), packed.tobytes(), encode_varints(runs)))
+
+
+def decode(data):
+    """Decode bytes from `encode` into (datetime64[s], uint8) arrays."""
+    if len(data) < HEADER.size:
+        raise CodecError('Too short for a header')
+    magic, version, first_bpm, start, count, run_count = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise CodecError('Not an encoded heart rate series')
+    if version != VERSION:
+        raise CodecError('Unsupported version %d' % (version, ))
+    if not count:
+        return np.zeros(0, dtype='datetime64[s]'), np.zeros(0, dtype=np.uint8)
+
+    buffer = np.frombuffer(data, dtype=np.uint8, offset=HEADER.size)
+    block_count = -(-count // BLOCK_SIZE)
+    widths = buffer[:block_count]
+    packed_size = int(widths.astype(np.int64).sum()) * (BLOCK_SIZE // 8)
+    deltas = unpack_blocks(widths, buffer[block_count:block_count + packed_size], count)
+    # The first delta is always zero.
+    bpm = (first_bpm + np.cumsum(unzigzag(deltas), dtype=np.int64)).astype(np.uint8)
+
+    runs, _ = decode_varints(buffer[block_count + packed_size:], 2 * run_count)
+    gaps = np.repeat(runs[0::2].astype(np.int64), runs[1::2].astype(np.int64))
+    if len(gaps) != count - 1:
+        raise CodecError('Gap runs cover %d samples, expected %d' % (len(gaps) + 1, count))
+    seconds = np.r_[start, start + np.cumsum(gaps)]
+    return seconds.astype('datetime64[s]'), bpm
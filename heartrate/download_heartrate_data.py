@@ -48,13 +48,16 @@ def download_hr_data(api, date):
 @asyncio.coroutine
 def async_main(secrets):
     client = secrets.create_oauth_client()
-    api = FitbitApi(client=client)
+    api = FitbitApi(client=client, priority='backfill')
     start_date = datetime.date(2016, 6, 1)
     day_count = (datetime.date.today() - start_date).days
-    yield from asyncio.gather(*[
-        download_hr_data(api, date)
-        for date in (start_date + datetime.timedelta(n) for n in range(day_count))
-    ])
+    try:
+        yield from asyncio.gather(*[
+            download_hr_data(api, date)
+            for date in (start_date + datetime.timedelta(n) for n in range(day_count))
+        ])
+    finally:
+        yield from client.close()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,108 @@
+import datetime
+import gzip
+import json
+import re
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+from .arrow_store import ARROW_DATA_STORE_DIR, export_arrays, frame_to_arrays, to_bpm_array
+
+
+CSV_DATA_STORE_FILE = './heartrate_datastore.csv.gz'
+NUMPY_DATA_STORE_FILE = './heartrate_datastore.h5'
+
+CSV_DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+# Units of integer timestamps, by the smallest value they can exceed for dates after 1973.
+EPOCH_UNITS = (('ns', 10 ** 17), ('us', 10 ** 14), ('ms', 10 ** 11), ('s', 0))
+# Fitbit's account export writes times as UTC, in this format.
+EXPORT_DATETIME_FORMAT = '%m/%d/%y %H:%M:%S'
+EXPORT_FILE_PATTERN = re.compile(r'(^|/)heart_rate-(\d{4}-\d{2}-\d{2})\.json$')
+
+
+def import_legacy_csv(filename=CSV_DATA_STORE_FILE):
+    with gzip.open(filename, 'rt', newline='') as file:
+        frame = pd.read_csv(
+            file,
+            header=None,
+            names=['Datetime', 'Heartrate(BPM)'],
+            skipinitialspace=True,
+            dtype={'Datetime': str, 'Heartrate(BPM)': np.float64},
+        )
+    times = parse_legacy_times(frame['Datetime'])
+    bpm = frame['Heartrate(BPM)'].values
+    present = ~np.isnan(bpm)
+    return times[present], to_bpm_array(bpm[present])
+
+
+def parse_legacy_times(values):
+    """Parse the legacy CSV's timestamps, either integers from the epoch or formatted strings.
+
+    `load_save.load_csv_data` reads them as integers; the unit is worked
+    out from their size.
+    """
+    values = values.str.strip()
+    if values.str.match(r'\d+$').all():
+        integers = values.astype(np.int64)
+        largest = integers.max() if len(integers) else 0
+        unit = next(unit for unit, smallest in EPOCH_UNITS if largest > smallest)
+        return pd.to_datetime(integers, unit=unit).values.astype('datetime64[s]')
+    # Parse every timestamp in one go with a fixed format, rather than inferring it per row.
+    return pd.to_datetime(values, format=CSV_DATETIME_FORMAT).values.astype('datetime64[s]')
+
+
+def to_local_times(times, timezone):
+    """Convert naive UTC times into naive local times.
+
+    `timezone` is a name such as 'Australia/Sydney', a `tzinfo`, or a
+    fixed `datetime.timedelta` offset from UTC.
+    """
+    if isinstance(timezone, datetime.timedelta):
+        timezone = datetime.timezone(timezone)
+    local = pd.DatetimeIndex(times).tz_localize('UTC').tz_convert(timezone).tz_localize(None)
+    return local.values.astype('datetime64[s]')
+
+
+def import_legacy_hdf(filename=NUMPY_DATA_STORE_FILE):
+    return frame_to_arrays(pd.read_hdf(filename, 'heartrate'))
+
+
+def iter_fitbit_export(archive_filename, timezone):
+    """Yield (times, bpm) arrays for each heart rate file in a Fitbit account export.
+
+    The export's UTC times are converted to local times in `timezone` (see
+    `to_local_times`), to match the API's data. A file's samples can then
+    fall on two local days, so store the whole export at once, as
+    `import_fitbit_export` does, rather than file by file.
+    """
+    with zipfile.ZipFile(archive_filename) as archive:
+        for name in sorted(archive.namelist()):
+            if not EXPORT_FILE_PATTERN.search(name):
+                continue
+            with archive.open(name) as file:
+                entries = json.loads(file.read().decode('utf-8'))
+            if not entries:
+                continue
+            times = to_local_times(pd.to_datetime(
+                [entry['dateTime'] for entry in entries], format=EXPORT_DATETIME_FORMAT,
+            ), timezone)
+            bpm = to_bpm_array([entry['value']['bpm'] for entry in entries])
+            yield times, bpm
+
+
+def import_fitbit_export(archive_filename, timezone):
+    parts = list(iter_fitbit_export(archive_filename, timezone))
+    if not parts:
+        return np.zeros(0, dtype='datetime64[s]'), np.zeros(0, dtype=np.uint8)
+    times, bpm = zip(*parts)
+    return np.concatenate(times), np.concatenate(bpm)
+
+
+def seed_store(times, bpm, directory=ARROW_DATA_STORE_DIR, format='arrow'):
+    """Add imported samples to the Arrow store; no API requests are made.
+
+    Samples are merged into days that are already stored, which keep their
+    own sample wherever both have one at the same time.
+    """
+    return export_arrays(times, bpm, directory, format, merge=True)
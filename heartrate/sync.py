@@ -0,0 +1,223 @@
+"""Multi-process sync of Fitbit data into the per-day Arrow store.
+
+    python -m heartrate.sync enqueue --user USER --start 2016-06-01
+    python -m heartrate.sync work --processes 4
+    python -m heartrate.sync status
+
+Processes on several hosts can share the databases over a network
+filesystem with `--journal-mode delete`; the default WAL journal only
+works on one host. `work --format` picks the store's format: 'arrow',
+'parquet' or the compact 'delta' encoding.
+
+Tasks live in a `WorkStore`; each worker process claims a few at a time
+with an expiring lease. Workers keep running until no tasks are
+pending, waiting out rate limits and the leases of workers that died.
+Workers share the SQLite secrets database, so token refreshes and the
+rate limit state are shared between them. After a day is stored its
+ingestion hooks run; by default these store the `heartrate.aggregators`
+statistics beside it.
+"""
+import argparse
+import asyncio
+import datetime
+import logging
+import multiprocessing
+import os
+import pathlib
+import socket
+
+from aio_fitbit.api import FitbitApi
+from aio_fitbit.apis._base import ENDPOINT_REGISTRY, ResponseCache
+from aio_fitbit.exceptions import FitbitApiLimitExceededException
+from aio_fitbit.secrets import SqliteSecretsDatabase
+from aio_fitbit.workqueue import WorkStore
+
+from .aggregators import IngestionPipeline
+from .arrow_store import ARROW_DATA_STORE_DIR, FORMATS, to_bpm_array, write_day
+
+
+WORK_STORE_FILE = './sync_work.db'
+SECRETS_DATABASE_FILE = './fitbit_secrets.db'
+
+
+def write_intraday_heartrate(directory, task, result, format='arrow'):
+    _, intraday = result
+    if intraday is None:
+        return None
+    user_directory = pathlib.Path(directory) / task.user_id
+    times = intraday.datetimes(task.date)
+    bpm = to_bpm_array(intraday.values)
+    write_day(user_directory, task.date, times, bpm, format)
+    return user_directory, times, bpm
+
+
+# Maps endpoint names to functions that store their results, called as
+# writer(directory, task, result, format). They return (directory, times,
+# values) for the ingestion hooks, or None if there was no data.
+RESULT_WRITERS = {
+    'intraday_heartrate': write_intraday_heartrate,
+}
+
+
+class SyncWorker():
+
+    def __init__(self, work_store, secrets_database, data_directory=ARROW_DATA_STORE_DIR, *,
+                 worker_id=None, concurrency=4, lease_seconds=300, idle_seconds=5, max_attempts=5,
+                 retry_seconds=60, ingestion_hooks=None, format='arrow'):
+        if format not in FORMATS:
+            raise ValueError('Unknown store format %r' % (format, ))
+        self.work_store = work_store
+        self.secrets_database = secrets_database
+        self.data_directory = data_directory
+        self.format = format
+        self.worker_id = worker_id or '%s:%s' % (socket.gethostname(), os.getpid())
+        self.concurrency = concurrency
+        self.lease_seconds = lease_seconds
+        self.idle_seconds = idle_seconds
+        self.max_attempts = max_attempts
+        # The shortest wait before a failed or rate limited task is retried.
+        self.retry_seconds = retry_seconds
+        if ingestion_hooks is None:
+            ingestion_hooks = (IngestionPipeline(), )
+        # Called as hook(directory, date, times, values) after each day is stored.
+        self.ingestion_hooks = ingestion_hooks
+        self._apis = {}
+
+    def api_for(self, user_id):
+        # One client per user for the life of the worker, so connections are reused.
+        if user_id not in self._apis:
+            secret_store = self.secrets_database.store_for(user_id)
+            client = secret_store.create_oauth_client()
+            # Each day is only fetched once, so don't hold on to the results.
+            self._apis[user_id] = FitbitApi(client=client, priority='backfill', cache=ResponseCache(max_entries=0))
+        return self._apis[user_id]
+
+    @asyncio.coroutine
+    def run(self, stop_when_idle=True):
+        try:
+            yield from self._run(stop_when_idle)
+        finally:
+            for api in self._apis.values():
+                yield from api._client.close()
+            self._apis.clear()
+
+    @asyncio.coroutine
+    def _run(self, stop_when_idle):
+        in_flight = {}
+        while True:
+            free = self.concurrency - len(in_flight)
+            if free > 0:
+                for task in self.work_store.claim(self.worker_id, limit=free, lease_seconds=self.lease_seconds):
+                    in_flight[asyncio.ensure_future(self.process(task))] = task
+            if not in_flight:
+                next_claimable = self.work_store.next_claimable()
+                if next_claimable is None:
+                    if stop_when_idle:
+                        return
+                    yield from asyncio.sleep(self.idle_seconds)
+                    continue
+                # Tasks are waiting to be retried, e.g. until the rate limit
+                # resets, or are leased by a worker that may have died.
+                delay = (next_claimable - datetime.datetime.now()).total_seconds()
+                yield from asyncio.sleep(max(0, delay))
+                continue
+            done, _ = yield from asyncio.wait(
+                list(in_flight), timeout=self.lease_seconds / 3, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                del in_flight[future]
+            if in_flight:
+                self.work_store.renew(
+                    self.worker_id, [task.id for task in in_flight.values()], self.lease_seconds)
+
+    @asyncio.coroutine
+    def process(self, task):
+        api = self.api_for(task.user_id)
+        endpoint = ENDPOINT_REGISTRY[task.endpoint](api_base=api)
+        try:
+            result = yield from endpoint.call(date=task.date)
+            stored = RESULT_WRITERS[task.endpoint](self.data_directory, task, result, self.format)
+            if stored is not None:
+                directory, times, values = stored
+                for hook in self.ingestion_hooks:
+                    hook(directory, task.date, times, values)
+        except FitbitApiLimitExceededException as e:
+            reset = api._client.scheduler.reset or datetime.datetime.now()
+            delay = max(self.retry_seconds, (reset - datetime.datetime.now()).total_seconds())
+            self.work_store.retry(self.worker_id, task.id, delay, str(e), count_attempt=False)
+        except Exception as e:
+            logging.exception('Task %s failed', task)
+            self.work_store.retry(
+                self.worker_id, task.id, self.retry_seconds * task.attempts, repr(e), max_attempts=self.max_attempts)
+        else:
+            self.work_store.complete(self.worker_id, task.id)
+
+
+def run_worker(work_store_file, secrets_database_file, data_directory, concurrency, journal_mode='wal',
+               format='arrow'):
+    worker = SyncWorker(
+        WorkStore(work_store_file, journal_mode=journal_mode),
+        SqliteSecretsDatabase(secrets_database_file, journal_mode=journal_mode),
+        data_directory,
+        concurrency=concurrency,
+        format=format,
+    )
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        loop.run_until_complete(worker.run())
+    finally:
+        loop.close()
+
+
+def parse_date(value):
+    return datetime.datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--work-db', default=WORK_STORE_FILE)
+    # WAL only works when every worker is on one host; see `SqliteDatabase`.
+    parser.add_argument('--journal-mode', default='wal', choices=['wal', 'delete'])
+    subparsers = parser.add_subparsers(dest='command')
+
+    enqueue = subparsers.add_parser('enqueue')
+    enqueue.add_argument('--user', action='append', required=True)
+    enqueue.add_argument('--start', type=parse_date, required=True)
+    enqueue.add_argument('--end', type=parse_date, default=datetime.date.today() - datetime.timedelta(days=1))
+    enqueue.add_argument('--endpoint', default='intraday_heartrate', choices=sorted(RESULT_WRITERS))
+
+    work = subparsers.add_parser('work')
+    work.add_argument('--secrets-db', default=SECRETS_DATABASE_FILE)
+    work.add_argument('--data-dir', default=ARROW_DATA_STORE_DIR)
+    work.add_argument('--processes', type=int, default=multiprocessing.cpu_count())
+    work.add_argument('--concurrency', type=int, default=4)
+    work.add_argument('--format', default='arrow', choices=sorted(FORMATS))
+
+    subparsers.add_parser('status')
+
+    args = parser.parse_args(argv)
+    if args.command == 'enqueue':
+        work_store = WorkStore(args.work_db, journal_mode=args.journal_mode)
+        for user_id in args.user:
+            added = work_store.enqueue_range(user_id, args.start, args.end, args.endpoint)
+            print('Queued', added, 'tasks for', user_id)
+    elif args.command == 'work':
+        processes = [
+            multiprocessing.Process(
+                target=run_worker,
+                args=(args.work_db, args.secrets_db, args.data_dir, args.concurrency, args.journal_mode, args.format),
+            )
+            for _ in range(args.processes)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+    elif args.command == 'status':
+        print(WorkStore(args.work_db, journal_mode=args.journal_mode).counts())
+    else:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
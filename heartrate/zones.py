@@ -0,0 +1,138 @@
+"""Heart rate zone summaries derived from stored intraday data.
+
+Fitbit's daily summary reports the minutes spent in each heart rate
+zone. For days whose intraday samples are already stored, the same
+`HeartrateResults` can be built locally, for a whole range of days at
+once, without using any API quota. Calories aren't derived, as they need
+the user's profile; they're left empty.
+"""
+from collections import namedtuple
+
+import numpy as np
+
+from aio_fitbit.apis.heartrate import HeartrateResults, HeartrateZone
+
+from .arrow_store import ARROW_DATA_STORE_DIR, read_range
+
+
+# A zone covers `min <= bpm < max`.
+ZoneDefinition = namedtuple('ZoneDefinition', ('name', 'min', 'max'))
+
+# Fractions of the maximum heart rate (or of the reserve, given a resting rate) that start each zone.
+STANDARD_ZONE_FRACTIONS = (
+    ('Out of Range', None),
+    ('Fat Burn', 0.5),
+    ('Cardio', 0.7),
+    ('Peak', 0.85),
+)
+LOWEST_HEART_RATE = 30
+HIGHEST_HEART_RATE = 220
+
+
+def standard_zones(age=None, max_heart_rate=None, resting_heart_rate=None):
+    """Return Fitbit's default zones.
+
+    The maximum heart rate defaults to 220 - age. With a resting heart rate
+    the zones are fractions of the heart rate reserve (the Karvonen method),
+    otherwise of the maximum heart rate.
+    """
+    if max_heart_rate is None:
+        if age is None:
+            raise ValueError('Give either `age` or `max_heart_rate`')
+        max_heart_rate = HIGHEST_HEART_RATE - age
+    base = resting_heart_rate or 0
+    starts = [LOWEST_HEART_RATE]
+    for _, fraction in STANDARD_ZONE_FRACTIONS[1:]:
+        starts.append(int(round(base + fraction * (max_heart_rate - base))))
+    ends = starts[1:] + [HIGHEST_HEART_RATE]
+    return tuple(
+        ZoneDefinition(name, start, end)
+        for (name, _), start, end in zip(STANDARD_ZONE_FRACTIONS, starts, ends)
+    )
+
+
+def _sample_seconds(times, max_gap):
+    """Seconds each sample stands for: until the next sample, but at most `max_gap`."""
+    seconds = times.astype(np.int64)
+    if len(seconds) < 2:
+        return np.full(len(seconds), min(60, max_gap), dtype=np.float64)
+    gaps = np.diff(seconds)
+    last = np.median(gaps)
+    return np.minimum(np.r_[gaps, last], max_gap).astype(np.float64)
+
+
+def _zone_minutes(day_offsets, day_count, bpm, durations, zones):
+    """Return a (days, zones) array of whole minutes spent in each zone."""
+    edges = np.array([zone.min for zone in zones])
+    upper = np.array([zone.max for zone in zones])
+    zone_index = np.searchsorted(edges, bpm, side='right') - 1
+    in_zone = zone_index >= 0
+    in_zone[in_zone] &= bpm[in_zone] < upper[zone_index[in_zone]]
+    seconds = np.bincount(
+        day_offsets[in_zone] * len(zones) + zone_index[in_zone],
+        weights=durations[in_zone],
+        minlength=day_count * len(zones),
+    )
+    return np.floor(seconds.reshape(day_count, len(zones)) / 60)
+
+
+def derive_zone_summaries(times, bpm, zones, custom_zones=None, start_date=None,
+                          resting_heart_rate=None, max_gap=60):
+    """Build `HeartrateResults` for every day covered by the samples.
+
+    `resting_heart_rate` may be an array with one value (or NaN) per day
+    from the start date.
+    """
+    times = np.asarray(times, dtype='datetime64[s]')
+    bpm = np.asarray(bpm).astype(np.int64)
+    if not len(times):
+        return HeartrateResults.empty()
+    order = np.argsort(times, kind='stable')
+    times = times[order]
+    bpm = bpm[order]
+
+    days = times.astype('datetime64[D]')
+    start = np.datetime64(start_date, 'D') if start_date is not None else days[0]
+    keep = days >= start
+    times, bpm, days = times[keep], bpm[keep], days[keep]
+    day_offsets = (days - start).astype(np.int64)
+    day_count = int(day_offsets[-1]) + 1 if len(day_offsets) else 0
+    durations = _sample_seconds(times, max_gap)
+
+    minutes = _zone_minutes(day_offsets, day_count, bpm, durations, zones)
+    zone_values = np.full((day_count, len(zones), len(HeartrateResults.ZONE_FIELDS)), np.nan)
+    zone_values[:, :, HeartrateResults.ZONE_FIELDS.index('min')] = [zone.min for zone in zones]
+    zone_values[:, :, HeartrateResults.ZONE_FIELDS.index('max')] = [zone.max for zone in zones]
+    zone_values[:, :, HeartrateResults.ZONE_FIELDS.index('minutes')] = minutes
+
+    present = np.bincount(day_offsets, minlength=day_count) > 0
+    custom_results = {}
+    if custom_zones:
+        custom_minutes = _zone_minutes(day_offsets, day_count, bpm, durations, custom_zones)
+        for offset in np.flatnonzero(present).tolist():
+            custom_results[offset] = tuple(
+                HeartrateZone(calories_out=None, min=zone.min, max=zone.max, minutes=int(zone_minutes), name=zone.name)
+                for zone, zone_minutes in zip(custom_zones, custom_minutes[offset].tolist())
+            )
+
+    resting = np.full(day_count, np.nan)
+    if resting_heart_rate is not None:
+        given = np.asarray(resting_heart_rate, dtype=np.float64)[:day_count]
+        resting[:len(given)] = given
+
+    return HeartrateResults(
+        start_date=start.item(),
+        present=present,
+        resting_heart_rate=resting,
+        zone_names=[zone.name for zone in zones],
+        zones=zone_values,
+        custom_zones=custom_results,
+    )
+
+
+def derive_from_store(zones, start=None, end=None, directory=ARROW_DATA_STORE_DIR, format='arrow', **kwargs):
+    """Derive zone summaries for the stored days between `start` and `end`, inclusive."""
+    table = read_range(directory, start, end, format)
+    times = table.column('Datetime').to_numpy()
+    bpm = table.column('Heartrate(BPM)').to_numpy()
+    return derive_zone_summaries(times, bpm, zones, start_date=start, **kwargs)
@@ -20,6 +20,7 @@ setup(
         'numpy',
         'matplotlib',
         'tables',
+        'pyarrow',
     ],
     tests_require=[
         'fitbit',
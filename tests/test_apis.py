@@ -0,0 +1,66 @@
+import asyncio
+import datetime
+
+import numpy as np
+import pytest
+
+from aio_fitbit.apis.activity import IntradayStepsEndpoint
+from aio_fitbit.apis._base import ApiBase
+from aio_fitbit.apis.timeseries import IntradayTimeSeries
+
+
+class FakeClient():
+
+    def __init__(self):
+        self.requests = []
+
+    @asyncio.coroutine
+    def request(self, method, url, **kwargs):
+        self.requests.append(url)
+        return url
+
+
+class FakeStepsEndpoint(IntradayStepsEndpoint):
+
+    NAME = None
+
+    @asyncio.coroutine
+    def parse_response(self, response):
+        return IntradayTimeSeries(
+            seconds=np.arange(0, 180, 60),
+            values=np.array([1, 2, 3], dtype=np.int32),
+            interval=1,
+            interval_type='minute',
+        )
+
+
+class FakeActivity(ApiBase):
+
+    intraday_steps = FakeStepsEndpoint.as_api()
+
+
+def call_twice(api, date):
+    loop = asyncio.new_event_loop()
+    try:
+        return [loop.run_until_complete(api.intraday_steps(date, detail_level='1min')) for _ in range(2)]
+    finally:
+        loop.close()
+
+
+def test_cached_series_is_read_only():
+    client = FakeClient()
+    first, second = call_twice(FakeActivity(client=client), datetime.date(2017, 1, 1))
+    assert len(client.requests) == 1
+    assert first is second
+    with pytest.raises(ValueError):
+        first.values[0] = 10
+    with pytest.raises(ValueError):
+        first.seconds[0] = 10
+
+
+def test_today_is_not_cached():
+    client = FakeClient()
+    first, second = call_twice(FakeActivity(client=client), datetime.date.today())
+    assert len(client.requests) == 2
+    first.values[0] = 10
+    assert second.values[0] == 1
@@ -0,0 +1,47 @@
+import datetime
+
+import numpy as np
+
+from heartrate.arrow_store import read_day, write_day
+from heartrate.importers import seed_store
+
+
+DAY = datetime.date(2020, 1, 2)
+
+
+def day_samples(start, stop, step=1):
+    seconds = np.arange(start, stop, step)
+    times = np.datetime64(DAY, 's') + seconds.astype('timedelta64[s]')
+    return times, (60 + seconds % 40).astype(np.uint8)
+
+
+def test_seeding_merges_with_a_stored_day(tmpdir):
+    directory = str(tmpdir)
+    times, bpm = day_samples(0, 86400)
+    write_day(directory, DAY, times, bpm)
+
+    # Overlaps stored samples, adds one after midnight the next day, and repeats a time.
+    seed_times, seed_bpm = day_samples(86000, 86410, 10)
+    seed_times = np.r_[seed_times, seed_times[-1]]
+    seed_bpm = np.r_[np.full(len(seed_bpm), 200, dtype=np.uint8), 201]
+    seed_store(seed_times, seed_bpm, directory)
+
+    stored = read_day(directory, DAY)
+    stored_times = stored.column('Datetime').to_numpy().astype('datetime64[s]')
+    stored_bpm = stored.column('Heartrate(BPM)').to_numpy()
+    assert len(stored) == 86400
+    assert (stored_times == times).all()
+    # Stored samples win over seeded ones at the same time.
+    assert (stored_bpm == bpm).all()
+
+    next_day = read_day(directory, DAY + datetime.timedelta(days=1))
+    assert len(next_day) == 1
+    assert next_day.column('Heartrate(BPM)').to_numpy().tolist() == [200]
+
+
+def test_seeding_merges_in_every_format(tmpdir):
+    for format in ('arrow', 'parquet', 'delta'):
+        directory = str(tmpdir.join(format))
+        seed_store(*day_samples(0, 100), directory=directory, format=format)
+        seed_store(*day_samples(50, 200), directory=directory, format=format)
+        assert len(read_day(directory, DAY, format)) == 200
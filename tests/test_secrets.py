@@ -0,0 +1,69 @@
+import asyncio
+import datetime
+import json
+
+import yaml
+
+from aio_fitbit.secrets import find_secret_file, SecretsFile
+from aio_fitbit.transport import Cassette, Interaction, ReplayTransport
+
+
+LIVE_CREDENTIALS = {
+    'access_token': 'live-access-token',
+    'refresh_token': 'live-refresh-token',
+    'expiry': datetime.datetime(2020, 1, 1),
+    'scopes': ['heartrate'],
+}
+
+
+def record_refresh(filename, access_token, refresh_token):
+    cassette = Cassette(filename)
+    cassette.append(Interaction(
+        method='POST',
+        url='https://api.fitbit.com/oauth2/token',
+        params=(),
+        request_headers=[],
+        status=200,
+        headers=[('Content-Type', 'application/json')],
+        body=json.dumps({
+            'access_token': access_token,
+            'refresh_token': refresh_token,
+            'expires_in': 3600,
+            'scope': 'heartrate',
+        }).encode('utf-8'),
+        elapsed=0.0,
+        raw=False,
+    ))
+    return cassette
+
+
+def test_replayed_refresh_does_not_save_credentials(tmpdir):
+    secrets_filename = str(tmpdir.join('.fitbit.secret'))
+    with open(secrets_filename, 'w') as file:
+        yaml.safe_dump({
+            'client': {'id': 'client-id', 'secret': 'client-secret'},
+            'user': LIVE_CREDENTIALS,
+        }, file)
+
+    for access_token, refresh_token in (('REDACTED', 'REDACTED'), ('stale-access-token', 'stale-refresh-token')):
+        cassette = record_refresh(str(tmpdir.join(access_token + '.jsonl.gz')), access_token, refresh_token)
+        client = SecretsFile(secrets_filename).create_oauth_client(transport=ReplayTransport(cassette))
+        loop = asyncio.new_event_loop()
+        try:
+            assert loop.run_until_complete(client.refresh_token())
+        finally:
+            loop.close()
+        assert client.access_token == LIVE_CREDENTIALS['access_token']
+
+        with open(secrets_filename) as file:
+            assert yaml.safe_load(file)['user'] == LIVE_CREDENTIALS
+
+
+def test_nearest_secret_file_wins(tmpdir):
+    parent = tmpdir.mkdir('parent')
+    child = parent.mkdir('child')
+    parent.join('.fitbit.secret').write('')
+    child.join('.Fitbit.Secret').write('')
+
+    assert find_secret_file(str(child)).name == '.Fitbit.Secret'
+    assert find_secret_file(str(child), multicase=False).parent.name == 'parent'
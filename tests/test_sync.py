@@ -0,0 +1,98 @@
+import asyncio
+import datetime
+from types import SimpleNamespace
+
+import numpy as np
+
+from aio_fitbit.exceptions import FitbitApiLimitExceededException
+from aio_fitbit.workqueue import WorkStore
+
+from heartrate import sync
+from heartrate.arrow_store import read_day, stored_dates
+
+
+class RateLimitedEndpoint():
+    """Rate limited on the first call, succeeds after that."""
+
+    calls = []
+
+    def __init__(self, *, api_base):
+        self.api_base = api_base
+
+    @asyncio.coroutine
+    def call(self, date):
+        self.calls.append(datetime.datetime.now())
+        if len(self.calls) == 1:
+            self.api_base._client.scheduler.reset = datetime.datetime.now() + datetime.timedelta(seconds=0.2)
+            raise FitbitApiLimitExceededException('Response status 429')
+        return date
+
+
+def test_worker_waits_for_rate_limited_task(tmpdir, monkeypatch):
+    monkeypatch.setitem(sync.ENDPOINT_REGISTRY, 'rate_limited', RateLimitedEndpoint)
+    monkeypatch.setitem(sync.RESULT_WRITERS, 'rate_limited', lambda directory, task, result, format: None)
+    RateLimitedEndpoint.calls = []
+    work_store = WorkStore(tmpdir.join('work.db'))
+    work_store.enqueue([('user', datetime.date(2017, 1, 1), 'rate_limited')])
+
+    worker = sync.SyncWorker(work_store, None, str(tmpdir), retry_seconds=0.1)
+    api = SimpleNamespace(_client=SimpleNamespace(scheduler=SimpleNamespace(reset=None)))
+    monkeypatch.setattr(worker, 'api_for', lambda user_id: api)
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(worker.run())
+    finally:
+        loop.close()
+
+    assert len(RateLimitedEndpoint.calls) == 2
+    assert RateLimitedEndpoint.calls[1] - RateLimitedEndpoint.calls[0] >= datetime.timedelta(seconds=0.2)
+    assert work_store.counts() == {'done': 1}
+    assert work_store.next_claimable() is None
+
+
+def test_worker_reclaims_expired_lease(tmpdir, monkeypatch):
+    monkeypatch.setitem(sync.ENDPOINT_REGISTRY, 'rate_limited', RateLimitedEndpoint)
+    monkeypatch.setitem(sync.RESULT_WRITERS, 'rate_limited', lambda directory, task, result, format: None)
+    # Skip the rate limit, so only the lease is waited on.
+    RateLimitedEndpoint.calls = [None]
+    work_store = WorkStore(tmpdir.join('work.db'))
+    work_store.enqueue([('user', datetime.date(2017, 1, 1), 'rate_limited')])
+    # Claimed by a worker that then died.
+    work_store.claim('dead-worker', lease_seconds=0.2)
+
+    worker = sync.SyncWorker(work_store, None, str(tmpdir))
+    monkeypatch.setattr(worker, 'api_for', lambda user_id: None)
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(worker.run())
+    finally:
+        loop.close()
+
+    assert work_store.counts() == {'done': 1}
+
+
+def test_worker_writes_the_chosen_format(tmpdir, monkeypatch):
+    times = np.datetime64('2017-01-01', 's') + np.arange(3).astype('timedelta64[s]')
+    intraday = SimpleNamespace(datetimes=lambda date: times, values=np.array([60.0, 61.0, 62.0]))
+
+    class IntradayEndpoint(RateLimitedEndpoint):
+
+        @asyncio.coroutine
+        def call(self, date):
+            return None, intraday
+
+    monkeypatch.setitem(sync.ENDPOINT_REGISTRY, 'intraday_heartrate', IntradayEndpoint)
+    work_store = WorkStore(tmpdir.join('work.db'))
+    work_store.enqueue([('user', datetime.date(2017, 1, 1), 'intraday_heartrate')])
+
+    worker = sync.SyncWorker(work_store, None, str(tmpdir.join('data')), format='delta', ingestion_hooks=())
+    monkeypatch.setattr(worker, 'api_for', lambda user_id: None)
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(worker.run())
+    finally:
+        loop.close()
+
+    directory = str(tmpdir.join('data', 'user'))
+    assert stored_dates(directory, 'delta') == {datetime.date(2017, 1, 1)}
+    assert read_day(directory, datetime.date(2017, 1, 1), 'delta').column('Heartrate(BPM)').to_pylist() == [60, 61, 62]